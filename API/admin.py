@@ -1,9 +1,23 @@
 from django.contrib import admin
-from .models import User, Post, Comment, Like, Follow
+from .models import User, Post, Comment, Like, Follow, OutboxEmail
+from .reaper import tombstone
+
+
+class TombstoneAdmin(admin.ModelAdmin):
+    """Deleting hides the row, the reap command deletes it and its dependents later"""
+
+    def delete_model(self, request, obj):
+        tombstone(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            tombstone(obj)
+
 
 # Register your models here.
-admin.site.register(User)
-admin.site.register(Post)
+admin.site.register(User, TombstoneAdmin)
+admin.site.register(Post, TombstoneAdmin)
 admin.site.register(Comment)
 admin.site.register(Like)
 admin.site.register(Follow)
+admin.site.register(OutboxEmail)
@@ -0,0 +1,123 @@
+"""
+Async versions of the hot read endpoints, for deployments served by an ASGI
+server. They return the same JSON as their DRF counterparts in views.py.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, NotFound
+from rest_framework.request import Request, ForcedAuthentication
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from .cache import aget_profile, aset_profile
+from .models import User, Post, Comment, Follow
+from .pagination import FeedPagination, CommentPagination, TrendingPagination
+from .projections import Projector, POST_COLUMNS, COMMENT_COLUMNS, TRENDING_COLUMNS
+from .renderers import json_renderer
+from .serializers import UserSerializer, ProfileSerializer, is_compact, profile_variant
+from . import timeline
+
+jwt_authentication = JWTStatelessUserAuthentication()
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(json_renderer().render(data), status=status_code, content_type="application/json")
+
+
+async def authenticate(request):
+    """A TokenUser built from a valid bearer token, None when the request carries no token"""
+    header = jwt_authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = jwt_authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    return jwt_authentication.get_user(jwt_authentication.get_validated_token(raw_token))
+
+
+def async_api_view(authenticated=True):
+    """Wraps an async GET view with JWT authentication and DRF-style error responses"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != "GET":
+                return render({"detail": f'Method "{request.method}" not allowed.'},
+                              status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                user = await authenticate(request)
+                if authenticated and user is None:
+                    raise NotAuthenticated()
+                authenticators = (ForcedAuthentication(user, None),) if user else ()
+                return await view(Request(request, authenticators=authenticators), *args, **kwargs)
+            except APIException as exc:
+                data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+                response = render(data, exc.status_code)
+                if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+                    response["WWW-Authenticate"] = jwt_authentication.authenticate_header(request)
+                return response
+        return wrapper
+    return decorator
+
+
+def projector_for(request):
+    return Projector(compact=is_compact({"request": request}))
+
+
+@async_api_view()
+async def feed(request):
+    user_id = request.user.id
+    posts = Post.objects.filter(status=Post.READY)
+    if await Follow.objects.filter(following=user_id).aexists():
+        paginator = FeedPagination()
+        page = await paginator.apaginate_feed(posts.values(*POST_COLUMNS), timeline.inbox(user_id),
+                                              timeline.pulled(user_id), request)
+    else:
+        # Following nobody, explore posts instead
+        paginator = TrendingPagination()
+        page = await paginator.apaginate_queryset(posts.values(*TRENDING_COLUMNS), request)
+    return render(paginator.get_paginated_data(await projector_for(request).aposts(page)))
+
+
+@async_api_view()
+async def post_detail(request, pk):
+    rows = [row async for row in Post.objects.filter(id=pk).values(*POST_COLUMNS)]
+    if not rows:
+        raise NotFound("No Post matches the given query.")
+    data = await projector_for(request).aposts(rows)
+    return render(data[0])
+
+
+@async_api_view(authenticated=False)
+async def comments(request, pk):
+    paginator = CommentPagination()
+    page = await paginator.apaginate_queryset(Comment.objects.filter(post=pk).values(*COMMENT_COLUMNS), request)
+    return render(paginator.get_paginated_data(await projector_for(request).acomments(page)))
+
+
+def build_expanded_profile(pk, request):
+    from .views import RetrieveUserAPIView
+
+    user = RetrieveUserAPIView.expanded_queryset.filter(pk=pk).first()
+    if user is None:
+        raise NotFound("No User matches the given query.")
+    return UserSerializer(user, context={"request": request}).data
+
+
+@async_api_view()
+async def profile(request, pk):
+    variant = profile_variant({"request": request})
+    entry = await aget_profile(pk, variant)
+    if entry is None:
+        if variant == "summary":
+            user = await User.objects.filter(pk=pk).afirst()
+            if user is None:
+                raise NotFound("No User matches the given query.")
+            payload = ProfileSerializer(user, context={"request": request}).data
+        else:
+            # The nested UserSerializer graph has no async equivalent, cache hits skip it
+            payload = await sync_to_async(build_expanded_profile)(pk, request)
+        await aset_profile(pk, variant, payload)
+    else:
+        payload, _ = entry
+    return render(payload)
@@ -0,0 +1,31 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from .cache import get_principal, set_principal
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that reads the token's user through the principal cache,
+    so only the first request of a user within PRINCIPAL_CACHE_TTL queries the database.
+    Inactive and tombstoned users are rejected either way. The request user is then
+    a User carrying only the cached PRINCIPAL_FIELDS.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        # Revocation is checked against the password hash, which is not cached
+        if user_id is None or api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+        fields = get_principal(user_id)
+        if fields is None:
+            # Only live users are found, and inactive ones are refused
+            user = super().get_user(validated_token)
+            set_principal(user_id, user)
+            return user
+
+        user = self.user_model(**fields)
+        if not user.is_active or user.deleted_at is not None:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+STAMP_KEY = "blacklist:stamp"
+
+
+class BlacklistFilter:
+    """
+    Per process set of the jtis of blacklisted refresh tokens that have not expired.
+
+    Recent rows are pulled by id when the shared stamp is newer than the last read or
+    at least every BLACKLIST_FILTER_TTL seconds, and the set is rebuilt every
+    BLACKLIST_FILTER_REBUILD_SECONDS to let go of expired tokens.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jtis = set()
+        self.last_id = 0
+        # Wall clock time, comparable with the stamp, at which the last read started
+        self.read_at = None
+        self.synced_at = None
+        self.built_at = None
+
+    def floor(self):
+        """
+        An id at or below which every row has been read. Ids are taken when a row is
+        inserted but it only shows once committed, so rows up to
+        BLACKLIST_FILTER_OVERLAP_IDS below the highest id read may still appear.
+        """
+        return max(self.last_id - settings.BLACKLIST_FILTER_OVERLAP_IDS, 0)
+
+    def rebuild(self, now):
+        self.read_at = time.time()
+        last_id = BlacklistedToken.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        self.jtis = set(BlacklistedToken.objects.filter(id__lte=last_id, token__expires_at__gt=timezone.now())
+                        .values_list("token__jti", flat=True))
+        self.last_id = max(self.last_id, last_id)
+        self.built_at = now
+
+    def pull(self):
+        self.read_at = time.time()
+        rows = BlacklistedToken.objects.filter(id__gt=self.floor()).values_list("id", "token__jti")
+        for row_id, jti in rows:
+            self.jtis.add(jti)
+            self.last_id = max(self.last_id, row_id)
+
+    def stale(self, now):
+        # A blacklisting announced before the last read started had been committed by then
+        stamp = cache.get(STAMP_KEY)
+        return (stamp is not None and stamp >= self.read_at) or now - self.synced_at > settings.BLACKLIST_FILTER_TTL
+
+    def sync(self):
+        now = time.monotonic()
+        if self.built_at is None or now - self.built_at > settings.BLACKLIST_FILTER_REBUILD_SECONDS:
+            self.rebuild(now)
+        elif self.stale(now):
+            self.pull()
+        else:
+            return
+        self.synced_at = now
+
+    def might_contain(self, jti):
+        """False only when `jti` was not blacklisted as of the last sync"""
+        with self.lock:
+            self.sync()
+            return jti in self.jtis
+
+    def add(self, jti):
+        with self.lock:
+            self.jtis.add(jti)
+
+
+blacklist_filter = BlacklistFilter()
+
+
+def announce(jti):
+    """Record a committed blacklisting here and tell the other processes to pull it"""
+    blacklist_filter.add(jti)
+    cache.set(STAMP_KEY, time.time(), timeout=None)
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken that asks the database about the blacklist only when the filter has the jti"""
+
+    def check_blacklist(self):
+        if blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
@@ -0,0 +1,185 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+PROFILE_VARIANTS = ("summary", "full", "compact")
+HITS_KEY = "profile:stats:hits"
+MISSES_KEY = "profile:stats:misses"
+# Version kind of a user as shown inside other resources: posts, comments and follow lists
+SHOWN_USER = "shown-user"
+
+
+def profile_key(user_id, variant):
+    return f"profile:{user_id}:{variant}"
+
+
+def _count(key):
+    # add() is a no-op when the key exists, incr() is atomic on shared backends
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def shown_users(payload):
+    """Ids of the users serialized anywhere in `payload`"""
+    if isinstance(payload, dict):
+        users = {payload["id"]} if "id" in payload and "username" in payload else set()
+        for value in payload.values():
+            users |= shown_users(value)
+        return users
+    if isinstance(payload, list):
+        return set().union(*map(shown_users, payload))
+    return set()
+
+
+def get_profile(user_id, variant):
+    """
+    Cached (serialized profile payload, versions of the users it shows) or None, recording
+    the hit or miss. An entry is stale as soon as one of the users it shows has changed.
+    """
+    entry = cache.get(profile_key(user_id, variant))
+    if entry is not None and get_versions(SHOWN_USER, entry[1]) != entry[1]:
+        entry = None
+    _count(MISSES_KEY if entry is None else HITS_KEY)
+    return entry
+
+
+def set_profile(user_id, variant, payload):
+    """Cache `payload` and return the versions of the users it shows"""
+    versions = get_versions(SHOWN_USER, shown_users(payload))
+    cache.set(profile_key(user_id, variant), (payload, versions), timeout=settings.PROFILE_CACHE_TTL)
+    return versions
+
+
+async def _acount(key):
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        pass
+
+
+async def aget_profile(user_id, variant):
+    entry = await cache.aget(profile_key(user_id, variant))
+    if entry is not None and await aget_versions(SHOWN_USER, entry[1]) != entry[1]:
+        entry = None
+    await _acount(MISSES_KEY if entry is None else HITS_KEY)
+    return entry
+
+
+async def aset_profile(user_id, variant, payload):
+    versions = await aget_versions(SHOWN_USER, shown_users(payload))
+    await cache.aset(profile_key(user_id, variant), (payload, versions), timeout=settings.PROFILE_CACHE_TTL)
+    return versions
+
+
+def invalidate_profiles(*user_ids):
+    """Drop the cached profiles of `user_ids` once the current transaction commits"""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    keys = [profile_key(user_id, variant) for user_id in user_ids for variant in PROFILE_VARIANTS]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+    bump_versions("user", user_ids)
+
+
+def is_shared():
+    """Whether every worker process sees the same default cache"""
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def version_key(kind, object_id):
+    return f"version:{kind}:{object_id}"
+
+
+def bump_versions(kind, object_ids):
+    """Mark resources as changed now, once the current transaction commits"""
+    keys = {version_key(kind, object_id): None for object_id in object_ids if object_id}
+    if keys:
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, time.time()), timeout=None))
+
+
+def get_versions(kind, object_ids):
+    """Timestamp of the last change of each resource, starting a new version for unknown ones"""
+    keys = {version_key(kind, object_id): object_id for object_id in object_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: value for key, value in found.items()}
+    now = time.time()
+    for key, object_id in keys.items():
+        if key not in found:
+            # add() so that concurrent readers settle on the same version
+            cache.add(key, now, timeout=None)
+            versions[object_id] = cache.get(key, now)
+    return versions
+
+
+async def aget_versions(kind, object_ids):
+    keys = {version_key(kind, object_id): object_id for object_id in object_ids}
+    found = await cache.aget_many(keys)
+    versions = {keys[key]: value for key, value in found.items()}
+    now = time.time()
+    for key, object_id in keys.items():
+        if key not in found:
+            await cache.aadd(key, now, timeout=None)
+            versions[object_id] = await cache.aget(key, now)
+    return versions
+
+
+def version_stamp(versions):
+    """The versions of a dict of them as one string, e.g. for an ETag"""
+    return "|".join(f"{object_id}:{version}" for object_id, version in sorted(versions.items()))
+
+
+def profile_cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+
+
+# Users resolved from access tokens, kept per process in front of the shared cache
+_principals = {}
+# What authentication needs of a user, the rest of the row, password included, is not cached
+PRINCIPAL_FIELDS = ("id", "username", "is_active", "deleted_at")
+
+
+def principal_key(user_id):
+    return f"principal:{user_id}"
+
+
+def get_principal(user_id):
+    """The cached PRINCIPAL_FIELDS of `user_id` or None, each layer may be up to PRINCIPAL_CACHE_TTL old"""
+    entry = _principals.get(user_id)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    user = cache.get(principal_key(user_id))
+    if user is not None:
+        _remember_principal(user_id, user)
+    return user
+
+
+def set_principal(user_id, user):
+    fields = {name: getattr(user, name) for name in PRINCIPAL_FIELDS}
+    cache.set(principal_key(user_id), fields, timeout=settings.PRINCIPAL_CACHE_TTL)
+    _remember_principal(user_id, fields)
+
+
+def _remember_principal(user_id, user):
+    if len(_principals) >= settings.PRINCIPAL_LOCAL_MAX_SIZE:
+        _principals.clear()
+    _principals[user_id] = (time.monotonic() + settings.PRINCIPAL_CACHE_TTL, user)
+
+
+def invalidate_principal(user_id):
+    """Forget a changed user here now and everywhere once the transaction commits"""
+    _principals.pop(user_id, None)
+
+    def forget():
+        _principals.pop(user_id, None)
+        cache.delete(principal_key(user_id))
+    transaction.on_commit(forget)
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from API.models import User, Post, Comment, Like
+from API.projections import Projector, POST_COLUMNS
+from API.serializers import PostSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare PostSerializer with the values() projection on generated posts, rolled back afterwards"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=50)
+        parser.add_argument("--comments", type=int, default=5, help="Comments and likes per post")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def generate(self, posts, comments):
+        users = User.objects.bulk_create(
+            User(username=f"bench{i}", email=f"bench{i}@example.com", avatar="bench")
+            for i in range(comments + 1))
+        created = Post.objects.bulk_create(
+            Post(message=f"post {i}", image="bench", owner=users[0]) for i in range(posts))
+        Comment.objects.bulk_create(
+            Comment(message="comment", post=post, owner=user) for post in created for user in users[1:])
+        Like.objects.bulk_create(Like(post=post, owner=user) for post in created for user in users[1:])
+        return [post.id for post in created]
+
+    def timed(self, render, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            body = render()
+        return (time.perf_counter() - start) / repeat, body
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ids = self.generate(options["posts"], options["comments"])
+            now = timezone.now()
+            renderer = JSONRenderer()
+
+            def serializer_path():
+                posts = Post.objects.with_details().filter(id__in=ids)
+                return renderer.render(PostSerializer(posts, many=True, context={"now": now}).data)
+
+            def projection_path():
+                rows = Post.objects.filter(id__in=ids).values(*POST_COLUMNS)
+                return renderer.render(Projector(now=now).posts(rows))
+
+            slow, expected = self.timed(serializer_path, options["repeat"])
+            fast, actual = self.timed(projection_path, options["repeat"])
+            transaction.set_rollback(True)
+
+        if actual != expected:
+            raise CommandError("Projection output differs from PostSerializer output")
+        self.stdout.write(f"PostSerializer: {slow * 1000:.2f} ms")
+        self.stdout.write(f"Projection:     {fast * 1000:.2f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {slow / fast:.1f}x, output identical"))
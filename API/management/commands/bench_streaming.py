@@ -0,0 +1,80 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from API.models import User, Post
+from API.projections import Projector, POST_COLUMNS
+from API.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare JSONRenderer with ORJSONRenderer, then the buffered and the streamed post list "
+        "of the user with the most posts: time to first byte, total time and peak memory"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--rows", type=int, default=2000, help="Posts rendered in the renderer comparison")
+
+    def compare_renderers(self, rows, repeat):
+        data = Projector().posts(Post.objects.values(*POST_COLUMNS)[:rows])
+        timings = {}
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                body = renderer.render(data)
+            timings[type(renderer).__name__] = ((time.perf_counter() - start) / repeat, body)
+        (slow, expected), (fast, actual) = timings.values()
+        if actual != expected:
+            raise CommandError("ORJSONRenderer output differs from JSONRenderer output")
+        self.stdout.write(f"Rendering {len(data)} posts, {len(expected) / 1024:.0f} KiB:")
+        self.stdout.write(f"  JSONRenderer   {slow * 1000:8.2f} ms")
+        self.stdout.write(f"  ORJSONRenderer {fast * 1000:8.2f} ms  ({slow / fast:.1f}x, output identical)")
+
+    def fetch(self, client, url):
+        """(seconds to the first body byte, seconds to the last, body size)"""
+        start = time.perf_counter()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url} answered {response.status_code}")
+        if not response.streaming:
+            elapsed = time.perf_counter() - start
+            return elapsed, elapsed, len(response.content)
+        first, size = None, 0
+        for chunk in response.streaming_content:
+            first = first or time.perf_counter() - start
+            size += len(chunk)
+        return first, time.perf_counter() - start, size
+
+    def peak_memory(self, client, url):
+        tracemalloc.start()
+        try:
+            self.fetch(client, url)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        self.compare_renderers(options["rows"], repeat)
+
+        owner = User.objects.annotate(posts_made=Count("posts")).order_by("-posts_made").first()
+        if owner is None or not owner.posts_made:
+            raise CommandError("No posts to list, run generate_data first")
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(owner)}")
+        self.stdout.write(f"\nListing the {owner.posts_made} posts of {owner.username}:")
+        self.stdout.write(f"  {'':<10}{'first byte ms':>15}{'total ms':>10}{'peak MiB':>10}{'KiB':>8}")
+        with override_settings(ALLOWED_HOSTS=["testserver"], STREAM_MAX_ROWS=owner.posts_made):
+            for name, url in (("buffered", "/API/posts"), ("streamed", "/API/posts?stream=true")):
+                runs = [self.fetch(client, url) for _ in range(repeat)]
+                first, total, size = (sorted(values)[len(values) // 2] for values in zip(*runs))
+                peak = self.peak_memory(client, url)
+                self.stdout.write(f"  {name:<10}{first * 1000:>15.1f}{total * 1000:>10.1f}"
+                                  f"{peak / 1048576:>10.1f}{size / 1024:>8.0f}")
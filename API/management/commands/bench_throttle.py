@@ -0,0 +1,61 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import UserRateThrottle
+from API.throttling import UserBucketThrottle, AddressBucketThrottle
+
+
+class BenchUser:
+    is_authenticated = True
+
+    def __init__(self, user_id):
+        self.id = self.pk = user_id
+
+
+class Command(BaseCommand):
+    help = "Time a throttle check of the token bucket throttles against DRF's UserRateThrottle"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=20000)
+        parser.add_argument("--limit", type=int, default=1000, help="Requests allowed per minute per client")
+
+    def timed(self, throttle, requests, view, checks):
+        """Microseconds per allow_request, cycling through clients so every check is allowed"""
+        start = time.perf_counter()
+        for i in range(checks):
+            if not throttle.allow_request(requests[i % len(requests)], view):
+                raise AssertionError(f"{type(throttle).__name__} refused a request")
+        return (time.perf_counter() - start) / checks * 1000000
+
+    def handle(self, *args, **options):
+        checks, limit = options["checks"], options["limit"]
+        # A scope of its own keeps the run away from real buckets in a shared cache
+        scope = f"bench-{uuid.uuid4().hex}"
+        requests = []
+        for i in range(-(-checks // limit)):
+            request = APIRequestFactory().post("/", REMOTE_ADDR=f"10.{i // 65536}.{i // 256 % 256}.{i % 256}")
+            request.user = BenchUser(i)
+            requests.append(request)
+
+        rate = f"{limit}/min"
+        scoped = type("ScopedView", (), {"throttle_scope": scope})()
+        rest_framework = {**settings.REST_FRAMEWORK,
+                          "DEFAULT_THROTTLE_RATES": {f"{scope}.user": rate, f"{scope}.ip": rate}}
+        drf_throttle = type("DRFUserRateThrottle", (UserRateThrottle,), {"scope": scope, "THROTTLE_RATES": {scope: rate}})
+        candidates = [
+            ("unthrottled view", UserBucketThrottle(), object()),
+            ("UserBucketThrottle", UserBucketThrottle(), scoped),
+            ("AddressBucketThrottle", AddressBucketThrottle(), scoped),
+            ("DRF UserRateThrottle", drf_throttle(), scoped),
+        ]
+
+        self.stdout.write(f"{checks} checks over {len(requests)} clients at {rate}, "
+                          f"{type(caches['default']).__name__}")
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            for name, throttle, view in candidates:
+                self.stdout.write(f"{name:<24}{self.timed(throttle, requests, view, checks):>8.1f} us/check")
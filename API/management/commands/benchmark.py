@@ -0,0 +1,305 @@
+import json
+import statistics
+import subprocess
+import time
+from contextlib import ExitStack, contextmanager
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import smart_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from API.cache import principal_key
+from API.models import User, Post, Like, Follow
+from API.urls import urlpatterns
+
+PASSWORD = "bench-password"
+# Endpoints that hash a password on every request are run at most this many times
+HASHING_REQUESTS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every API route in process and report p50/p95/p99 latency, throughput and queries "
+        "per endpoint. Runs against a copy of the database, dropped at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Timed requests per endpoint")
+        parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per endpoint")
+        parser.add_argument("--user-id", type=int,
+                            help="User to authenticate as, defaults to the one following the most users")
+        parser.add_argument("--only", help="Comma separated endpoints, e.g. user_feed,posts:get")
+        parser.add_argument("--json", dest="json_path", help="Write the results to this file")
+        parser.add_argument("--compare", help="Results file of an earlier run to compare against")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Relative p95 slowdown reported as a regression by --compare")
+        parser.add_argument("--without-metrics", action="store_true",
+                            help="Leave out MetricsMiddleware, to measure its overhead with --compare")
+
+    def pick_fixtures(self, user_id):
+        users = User.objects.all()
+        user = users.get(id=user_id) if user_id else users.order_by("-following_count", "id").first()
+        if user is None:
+            raise CommandError("No users to benchmark with, run generate_data first")
+        self.user = user
+        self.others = list(User.objects.exclude(id=user.id).order_by("-follower_count", "id")[:10])
+        self.posts = list(Post.objects.exclude(owner=user).order_by("-like_count", "-id")[:10])
+        if not self.others or not self.posts:
+            raise CommandError("The benchmark needs other users with posts, run generate_data first")
+        self.other = self.others[0]
+        self.post = self.posts[0]
+        self.own_post = Post.objects.create(owner=user, message="benchmark", image="synthetic/post")
+
+        # Staff so the admin endpoint is exercised, with a known password for the token endpoints
+        user.is_staff = True
+        user.set_password(PASSWORD)
+        user.save(update_fields=["is_staff", "password"])
+        cache.delete(principal_key(user.id))
+
+    def scenarios(self):
+        """(endpoint, method) -> (callable returning the next path and body, optional setup)"""
+        user, other, post = self.user, self.other, self.post
+        post_ids = [p.id for p in self.posts]
+        other_ids = [u.id for u in self.others]
+        serial = count()
+
+        def path(name, **kwargs):
+            return reverse(name, kwargs=kwargs or None)
+
+        def unliked(post_ids):
+            Like.objects.filter(owner=user, post_id__in=post_ids).delete()
+
+        def liked(post_ids):
+            Like.objects.bulk_create([Like(owner=user, post_id=post_id) for post_id in post_ids],
+                                     ignore_conflicts=True)
+
+        def unfollowed(user_ids):
+            Follow.objects.filter(following=user, followed_id__in=user_ids).delete()
+
+        def followed(user_ids):
+            Follow.objects.bulk_create([Follow(following=user, followed_id=user_id) for user_id in user_ids],
+                                       ignore_conflicts=True)
+
+        def restored():
+            User.all_objects.filter(id=user.id).update(deleted_at=None, is_active=True)
+            cache.delete(principal_key(user.id))
+
+        def new_user():
+            n = next(serial)
+            return path("create_user"), {"username": f"bench{n}", "email": f"bench{n}@example.com",
+                                         "password": PASSWORD}
+
+        def deleted_post():
+            doomed = Post.objects.create(owner=user, message="benchmark", image="synthetic/post")
+            return path("post_update_delete", pk=doomed.id), None
+
+        def reset_password():
+            token = PasswordResetTokenGenerator().make_token(User.objects.get(id=user.id))
+            return path("reset_password"), {"password": PASSWORD, "token": token,
+                                            "uidb64": urlsafe_base64_encode(smart_bytes(user.id))}
+
+        requests = {
+            ("create_user", "post"): new_user,
+            ("user_profile", "get"): lambda: (path("user_profile", pk=other.id), None),
+            ("user_posts", "get"): lambda: (path("user_posts", pk=other.id), None),
+            ("user_followers", "get"): lambda: (path("user_followers", pk=other.id), None),
+            ("user_following", "get"): lambda: (path("user_following", pk=user.id), None),
+            ("update_profile", "put"): lambda: (path("update_profile", pk=user.id), {
+                "username": user.username, "email": user.email, "bio": "benchmark", "gender": "female",
+                "avatar": "synthetic/avatar"}),
+            ("update_avatar", "put"): lambda: (path("update_avatar", pk=user.id), {"avatar": "synthetic/avatar"}),
+            ("user_suggestions", "get"): lambda: (path("user_suggestions"), None),
+            ("user_export", "get"): lambda: (path("user_export"), None),
+            ("list_users", "get"): lambda: (path("list_users") + f"?username={other.username[:4]}", None),
+            ("profile_cache_stats", "get"): lambda: (path("profile_cache_stats"), None),
+            ("metrics", "get"): lambda: (path("metrics"), None),
+            ("posts", "get"): lambda: (path("posts"), None),
+            ("posts", "post"): lambda: (path("posts"), {"message": "benchmark", "image": "synthetic/post"}),
+            ("post_update_delete", "get"): lambda: (path("post_update_delete", pk=post.id), None),
+            ("post_update_delete", "patch"): lambda: (path("post_update_delete", pk=self.own_post.id),
+                                                      {"message": "edited"}),
+            ("post_update_delete", "delete"): deleted_post,
+            ("comments", "get"): lambda: (path("comments", pk=post.id), None),
+            ("comments", "post"): lambda: (path("comments", pk=post.id), {"message": "benchmark"}),
+            ("add_like", "post"): lambda: (path("add_like", pk=post.id), None),
+            ("remove_like", "delete"): lambda: (path("remove_like", pk=post.id), None),
+            ("batch_like", "post"): lambda: (path("batch_like"), {"ids": post_ids}),
+            ("batch_unlike", "post"): lambda: (path("batch_unlike"), {"ids": post_ids}),
+            ("user_feed", "get"): lambda: (path("user_feed"), None),
+            ("explore", "get"): lambda: (path("explore"), None),
+            ("follow_user", "post"): lambda: (path("follow_user"), {"follow_id": other.id}),
+            ("unfollow_user", "delete"): lambda: (path("unfollow_user", pk=other.id), None),
+            ("batch_follow", "post"): lambda: (path("batch_follow"), {"ids": other_ids}),
+            ("batch_unfollow", "post"): lambda: (path("batch_unfollow"), {"ids": other_ids}),
+            ("async_user_feed", "get"): lambda: (path("async_user_feed"), None),
+            ("async_user_profile", "get"): lambda: (path("async_user_profile", pk=other.id), None),
+            ("async_post_detail", "get"): lambda: (path("async_post_detail", pk=post.id), None),
+            ("async_comments", "get"): lambda: (path("async_comments", pk=post.id), None),
+            ("auth_token", "post"): lambda: (path("auth_token"), {"email": user.email, "password": PASSWORD}),
+            ("refresh_token", "post"): lambda: (path("refresh_token"), {"refresh": str(RefreshToken.for_user(user))}),
+            ("request_password_reset", "post"): lambda: (path("request_password_reset"), {"email": user.email}),
+            ("reset_password", "patch"): reset_password,
+            # Last, the benchmark user is deleted
+            ("delete_user", "delete"): lambda: (path("delete_user", pk=user.id), None),
+        }
+        # Untimed writes that restore the precondition of the next request
+        setups = {
+            ("add_like", "post"): lambda: unliked([post.id]),
+            ("remove_like", "delete"): lambda: liked([post.id]),
+            ("batch_like", "post"): lambda: unliked(post_ids),
+            ("batch_unlike", "post"): lambda: liked(post_ids),
+            ("follow_user", "post"): lambda: unfollowed([other.id]),
+            ("unfollow_user", "delete"): lambda: followed([other.id]),
+            ("batch_follow", "post"): lambda: unfollowed(other_ids),
+            ("batch_unfollow", "post"): lambda: followed(other_ids),
+            ("delete_user", "delete"): restored,
+        }
+        return {key: (make_request, setups.get(key)) for key, make_request in requests.items()}
+
+    def send(self, client, method, path, body):
+        if method == "get":
+            response = client.get(path)
+        else:
+            response = getattr(client, method)(path, body, format="json")
+        if response.streaming:
+            # A streamed body is only produced while it is read
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def prepare(self, make_request, setup):
+        if setup is not None:
+            setup()
+        return make_request()
+
+    def measure(self, client, method, make_request, setup, total, warmup):
+        for _ in range(warmup):
+            self.send(client, method, *self.prepare(make_request, setup))
+        latencies, queries, errors, statuses = [], 0, 0, set()
+        for _ in range(total):
+            path, body = self.prepare(make_request, setup)
+            # Reads may be routed to any replica
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                start = time.perf_counter()
+                response = self.send(client, method, path, body)
+                latencies.append(time.perf_counter() - start)
+            queries += sum(map(len, captured))
+            statuses.add(response.status_code)
+            errors += response.status_code >= 400
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive") if total > 1 else latencies * 99
+        return {
+            "requests": total,
+            "errors": errors,
+            "statuses": sorted(statuses),
+            "p50_ms": round(cuts[49] * 1000, 3),
+            "p95_ms": round(cuts[94] * 1000, 3),
+            "p99_ms": round(cuts[98] * 1000, 3),
+            "rps": round(total / sum(latencies), 1),
+            "queries": round(queries / total, 2),
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, results, baseline_path, tolerance):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)["endpoints"]
+        self.stdout.write(f"\nCompared with {baseline_path}")
+        self.stdout.write(f"{'endpoint':<34}{'p95 ms':>16}{'queries':>14}")
+        regressions = 0
+        for key, result in results.items():
+            before = baseline.get(key)
+            if before is None:
+                continue
+            slower = result["p95_ms"] > before["p95_ms"] * (1 + tolerance)
+            more_queries = result["queries"] > before["queries"]
+            regressions += slower or more_queries
+            self.stdout.write(
+                f"{key:<34}{before['p95_ms']:>7.1f} -> {result['p95_ms']:<6.1f}"
+                f"{before['queries']:>5.1f} -> {result['queries']:<5.1f}"
+                + (self.style.ERROR("  regression") if slower or more_queries else ""))
+        return regressions
+
+    @contextmanager
+    def throwaway_database(self):
+        """
+        Point every database alias at a copy of the primary for the length of the run. Requests
+        commit their writes there as in production, which runs their on_commit callbacks, and
+        their reads are routed to the replica aliases, which read the copy as well.
+        """
+        suffix = "benchmark"
+        creation = connections[DEFAULT_DB_ALIAS].creation
+        originals = {alias: dict(connections[alias].settings_dict) for alias in connections}
+        connections.close_all()
+        creation.clone_test_db(suffix, verbosity=0)
+        clone = creation.get_test_db_clone_settings(suffix)
+        try:
+            for alias in connections:
+                connections[alias].settings_dict.update(clone)
+            yield
+        finally:
+            connections.close_all()
+            for alias, settings_dict in originals.items():
+                connections[alias].settings_dict.update(settings_dict)
+            creation.destroy_test_db(verbosity=0, suffix=suffix)
+
+    def handle(self, *args, **options):
+        only = set(options["only"].split(",")) if options["only"] else None
+        results = {}
+        # The test client's host name
+        middleware = [name for name in settings.MIDDLEWARE
+                      if not (options["without_metrics"] and name == "API.middleware.MetricsMiddleware")]
+        # Throttles still take their tokens, from buckets too large to ever refuse a request
+        rest_framework = {**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {
+            scope: "1000000000/s" for scope in settings.REST_FRAMEWORK.get("DEFAULT_THROTTLE_RATES", {})}}
+        with override_settings(ALLOWED_HOSTS=["testserver"], MIDDLEWARE=middleware, REST_FRAMEWORK=rest_framework), \
+                self.throwaway_database():
+            self.pick_fixtures(options["user_id"])
+            access_token = str(RefreshToken.for_user(self.user).access_token)
+            scenarios = self.scenarios()
+            covered = {name for name, _ in scenarios}
+            for pattern in urlpatterns:
+                if pattern.name not in covered:
+                    self.stderr.write(f"No benchmark for the {pattern.name} route")
+
+            # The client's bearer token doubles as the metrics token
+            with override_settings(METRICS_TOKEN=access_token):
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+                self.stdout.write(f"{'endpoint':<34}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                                  f"{'req/s':>9}{'queries':>9}{'errors':>8}")
+                for (name, method), (make_request, setup) in scenarios.items():
+                    key = f"{name}:{method}"
+                    if only and name not in only and key not in only:
+                        continue
+                    total = options["requests"]
+                    if name in ("create_user", "auth_token", "reset_password"):
+                        total = min(total, HASHING_REQUESTS)
+                    result = results[key] = self.measure(client, method, make_request, setup, total,
+                                                         options["warmup"])
+                    self.stdout.write(f"{key:<34}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                                      f"{result['p99_ms']:>9.2f}{result['rps']:>9.1f}{result['queries']:>9.1f}"
+                                      f"{result['errors']:>8}")
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as output:
+                json.dump({"commit": self.commit(), "created_at": timezone.now().isoformat(),
+                           "user_id": self.user.id, "endpoints": results}, output, indent=2)
+        if options["compare"]:
+            regressions = self.compare(results, options["compare"], options["tolerance"])
+            if regressions:
+                raise CommandError(f"{regressions} endpoints regressed")
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from API.suggestions import FollowGraph, compute
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's who-to-follow suggestions from the follow graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=settings.SUGGESTIONS_PER_USER)
+        parser.add_argument("--neighbour-limit", type=int, default=settings.SUGGESTION_NEIGHBOUR_LIMIT,
+                            help="Longest follow list read per hop")
+        parser.add_argument("--cofollow-weight", type=float, default=settings.SUGGESTION_COFOLLOW_WEIGHT)
+        parser.add_argument("--batch-size", type=int, default=1000, help="Users stored per transaction")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        graph = FollowGraph.load()
+        loaded = time.perf_counter()
+        self.stdout.write(f"Loaded {graph.edges} follows between {len(graph.ids)} users "
+                          f"in {loaded - start:.1f}s")
+        users = compute(graph, options["batch_size"], options["top_k"], options["neighbour_limit"],
+                        options["cofollow_weight"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored suggestions for {users} users in {time.perf_counter() - loaded:.1f}s"))
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.text import compress_sequence
+from API import export
+from API.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a user's profile, posts, comments, likes and follows as NDJSON. Every line carries "
+        "a cursor, pass the last one written with --cursor to resume an interrupted export."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("user", help="Id or email of the user")
+        parser.add_argument("--output", help="File to write, standard output by default. Appended to when resuming")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output, a resumed export "
+                            "appends a gzip member that gzip reads as part of the same file")
+        parser.add_argument("--cursor", help="Resume after the line carrying this cursor")
+        parser.add_argument("--chunk-size", type=int, help="Rows read per database round trip")
+
+    def handle(self, *args, **options):
+        lookup = {"id": options["user"]} if options["user"].isdigit() else {"email": options["user"]}
+        user_id = User.objects.filter(**lookup).values_list("id", flat=True).first()
+        if user_id is None:
+            raise CommandError(f"No user {options['user']}")
+        try:
+            export.parse_cursor(options["cursor"])
+        except ValueError:
+            raise CommandError(f"Invalid cursor {options['cursor']}")
+
+        chunks = export.chunks(export.lines(user_id, options["cursor"], options["chunk_size"]))
+        if options["gzip"]:
+            chunks = compress_sequence(chunks)
+        output = open(options["output"], "ab" if options["cursor"] else "wb") if options["output"] else sys.stdout.buffer
+        try:
+            written = 0
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if options["output"]:
+                output.close()
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
@@ -0,0 +1,146 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from API.models import User, Post, Comment, Like, Follow
+
+WORDS = ("cat", "dog", "walk", "nap", "treat", "park", "ball", "sunny", "cute", "fluffy",
+         "puppy", "kitten", "bath", "vet", "toy", "garden", "snack", "zoomies", "cuddle", "friend")
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at values it is given"""
+    fields = [model._meta.get_field("created_at") for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk generate a synthetic social graph: power-law followers, posts, likes and comments "
+        "with stubbed images. Counters and timelines are rebuilt afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--follows", type=int, default=100000)
+        parser.add_argument("--likes", type=int, default=500000)
+        parser.add_argument("--comments", type=int, default=100000)
+        parser.add_argument("--alpha", type=float, default=1.1,
+                            help="Power-law exponent of follower, activity and like popularity")
+        parser.add_argument("--days", type=int, default=90, help="Time span the posts are spread over")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0, help="Seeds the generator and names the users")
+        parser.add_argument("--password", default="password", help="Password of every generated user")
+
+    def power_law(self, ids, alpha):
+        """Shuffled `ids` with cumulative weights falling off as rank ** -alpha"""
+        ids = list(ids)
+        self.rng.shuffle(ids)
+        return ids, list(accumulate(1 / (rank ** alpha) for rank in range(1, len(ids) + 1)))
+
+    def sentence(self, low, high):
+        return " ".join(self.rng.choices(WORDS, k=self.rng.randint(low, high)))
+
+    def in_batches(self, total, make_batch):
+        """Call make_batch(start, size) over `total` rows and collect the ids it returns"""
+        ids = []
+        for start in range(0, total, self.batch_size):
+            ids.extend(make_batch(start, min(self.batch_size, total - start)))
+        return ids
+
+    def create_users(self, total):
+        password = make_password(self.password)
+        seed = self.seed
+
+        def batch(start, size):
+            users = User.objects.bulk_create(
+                User(username=f"synth{seed}_{i}", email=f"synth{seed}_{i}@example.com", password=password,
+                     bio=self.sentence(0, 8), gender=self.rng.choice(("female", "male", None)),
+                     avatar="synthetic/avatar", created_at=self.start - timedelta(days=self.rng.randint(1, 365)))
+                for i in range(start, start + size))
+            return [user.id for user in users]
+        return self.in_batches(total, batch)
+
+    def create_follows(self, total):
+        followed, weights = self.power_law(self.user_ids, self.alpha)
+
+        def batch(start, size):
+            targets = self.rng.choices(followed, cum_weights=weights, k=size)
+            followers = self.rng.choices(self.user_ids, k=size)
+            Follow.objects.bulk_create(
+                [Follow(following_id=follower, followed_id=target)
+                 for follower, target in zip(followers, targets) if follower != target],
+                ignore_conflicts=True)
+            return []
+        self.in_batches(total, batch)
+
+    def post_time(self, index):
+        # Posts are spread evenly over the span in id order
+        return self.start + (self.now - self.start) * (index / len(self.post_ids))
+
+    def create_posts(self, total):
+        owners, weights = self.power_law(self.user_ids, self.alpha)
+        span = self.now - self.start
+
+        def batch(start, size):
+            posts = Post.objects.bulk_create(
+                Post(owner_id=owner, message=self.sentence(1, 12), image="synthetic/post",
+                     created_at=self.start + span * ((start + offset) / total))
+                for offset, owner in enumerate(self.rng.choices(owners, cum_weights=weights, k=size)))
+            return [post.id for post in posts]
+        return self.in_batches(total, batch)
+
+    def create_activity(self, model, total, **fields):
+        """Spread `total` likes or comments over power-law popular posts, each after its post"""
+        index_of = {post_id: index for index, post_id in enumerate(self.post_ids)}
+        popular, weights = self.power_law(self.post_ids, self.alpha)
+
+        def batch(start, size):
+            rows = []
+            for post_id in self.rng.choices(popular, cum_weights=weights, k=size):
+                posted = self.post_time(index_of[post_id])
+                rows.append(model(post_id=post_id, owner_id=self.rng.choice(self.user_ids),
+                                  created_at=posted + (self.now - posted) * self.rng.random(),
+                                  **{name: make() for name, make in fields.items()}))
+            # Likes are unique per post and owner, duplicates drawn here are skipped
+            model.objects.bulk_create(rows, ignore_conflicts=model is Like)
+            return []
+        self.in_batches(total, batch)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.seed = options["seed"]
+        self.alpha = options["alpha"]
+        self.batch_size = options["batch_size"]
+        self.password = options["password"]
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options["days"])
+
+        with explicit_timestamps(User, Post, Comment, Like):
+            self.user_ids = self.create_users(options["users"])
+            self.stdout.write(f"Created {len(self.user_ids)} users")
+            self.create_follows(options["follows"])
+            self.post_ids = self.create_posts(options["posts"])
+            self.stdout.write(f"Created {len(self.post_ids)} posts")
+            if self.post_ids:
+                self.create_activity(Like, options["likes"])
+                self.create_activity(Comment, options["comments"], message=lambda: self.sentence(1, 15))
+            self.stdout.write(f"Created {Follow.objects.count()} follows, {Like.objects.count()} likes "
+                              f"and {Comment.objects.count()} comments in total")
+
+        call_command("recount", stdout=self.stdout)
+        call_command("rebuild_timelines", stdout=self.stdout)
+        call_command("score_trending", "--full", stdout=self.stdout)
@@ -0,0 +1,63 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+from API.models import User, Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent throughput of the sync and async read endpoints of a running server, "
+        "e.g. one started with `gunicorn instapet.asgi:application -k uvicorn.workers.UvicornWorker`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000/API/")
+        parser.add_argument("--user-id", type=int, help="User to authenticate as, defaults to the first user")
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=1000, help="Requests per endpoint and mode")
+
+    def fetch(self, url, token):
+        request = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    def run(self, url, token, concurrency, total):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(lambda _: self.fetch(url, token), range(total)))
+            elapsed = time.perf_counter() - start
+        latencies = sorted(latency for latency, _ in results)
+        return {
+            "rps": total / elapsed,
+            "p50": statistics.median(latencies) * 1000,
+            "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            "errors": sum(1 for _, ok in results if not ok),
+        }
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        user = users.filter(id=options["user_id"]).first() if options["user_id"] else users.first()
+        post = Post.objects.order_by("-id").first()
+        if user is None or post is None:
+            raise CommandError("The load test needs at least one user and one post")
+        token = str(RefreshToken.for_user(user).access_token)
+
+        paths = ["feed", f"user/{post.owner_id}", f"post/{post.id}", f"post/{post.id}/comments"]
+        base_url = options["base_url"].rstrip("/") + "/"
+        self.stdout.write(f"{'endpoint':<24}{'mode':<7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+        for path in paths:
+            for mode, prefix in (("sync", ""), ("async", "async/")):
+                result = self.run(base_url + prefix + path, token, options["concurrency"], options["requests"])
+                self.stdout.write(f"{path:<24}{mode:<7}{result['rps']:>9.1f}{result['p50']:>9.1f}"
+                                  f"{result['p95']:>9.1f}{result['errors']:>8}")
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from API.uploads import process_batch
+
+
+class Command(BaseCommand):
+    help = "Push staged post images and avatars to the upload backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.UPLOAD_BATCH_SIZE)
+        parser.add_argument("--concurrency", type=int, default=settings.UPLOAD_CONCURRENCY,
+                            help="Number of uploads running at the same time")
+        parser.add_argument("--interval", type=float, default=2,
+                            help="Seconds to sleep when nothing is waiting")
+        parser.add_argument("--once", action="store_true", help="Process the queue once and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = process_batch(options["batch_size"], options["concurrency"])
+            if done or failed:
+                self.stdout.write(f"Uploaded {done} files, {failed} failed")
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
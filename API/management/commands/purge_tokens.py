@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding and blacklisted tokens in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.TOKEN_PURGE_BATCH_SIZE)
+        parser.add_argument("--pause", type=float, default=0.1,
+                            help="Seconds to sleep between batches that deleted rows")
+
+    def handle(self, *args, **options):
+        now = aware_utcnow()
+        last_id = 0
+        deleted = 0
+        while True:
+            # Walk the table by primary key so each batch is a short range scan
+            # and a short transaction, expires_at has no index
+            rows = list(OutstandingToken.objects.filter(id__gt=last_id).order_by("id")
+                        .values_list("id", "expires_at")[:options["batch_size"]])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            expired = [row_id for row_id, expires_at in rows if expires_at <= now]
+            if not expired:
+                continue
+            with transaction.atomic():
+                BlacklistedToken.objects.filter(token_id__in=expired).delete()
+                OutstandingToken.objects.filter(id__in=expired).delete()
+            deleted += len(expired)
+            time.sleep(options["pause"])
+        self.stdout.write(f"Deleted {deleted} expired tokens")
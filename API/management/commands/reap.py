@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from API.reaper import Reaper
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete tombstoned posts and users with everything hanging off them, a chunk per "
+        "transaction. Safe to interrupt, running it again picks up where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=settings.REAP_CHUNK_SIZE)
+        parser.add_argument("--pause", type=float, default=0.1,
+                            help="Seconds to sleep between chunks that deleted rows")
+
+    def handle(self, *args, **options):
+        def report(message):
+            if options["verbosity"] > 1:
+                self.stdout.write(message)
+
+        reaper = Reaper(options["chunk_size"], options["pause"], report)
+        posts, users, rows = reaper.run()
+        self.stdout.write(f"Reaped {posts} posts and {users} users, {rows} rows deleted")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from API.models import Follow, TimelineEntry
+from API import timeline
+
+
+class Command(BaseCommand):
+    help = "Rebuild every user's timeline from the follow graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true", help="Delete existing timeline entries first")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            TimelineEntry.objects.all().delete()
+        posts = timeline.mark_fanned_out()
+        self.stdout.write(f"Flagged {posts} posts as pushed or pulled")
+        follows = Follow.objects.values_list("following_id", "followed_id").iterator(chunk_size=1000)
+        edges = 0
+        for follower_id, followed_id in follows:
+            timeline.backfill(follower_id, followed_id)
+            edges += 1
+        self.stdout.write(self.style.SUCCESS(f"Backfilled timelines for {edges} follows"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from API.models import User, Post, Comment, Like, Follow
+from API.utils import count_of
+
+
+class Command(BaseCommand):
+    help = "Recompute the like/comment counters on posts and the follower/following counters on users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Number of rows updated per transaction")
+
+    def recount(self, model, batch_size, **counters):
+        """Update `model` in primary key ranges so no single transaction holds the table for long"""
+        last_id = model.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                updated += model.objects.filter(pk__gt=start, pk__lte=start + batch_size).update(**counters)
+        return updated
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        posts = self.recount(Post, batch_size,
+                             like_count=count_of(Like, "post"),
+                             comment_count=count_of(Comment, "post"))
+        users = self.recount(User, batch_size,
+                             follower_count=count_of(Follow, "followed"),
+                             following_count=count_of(Follow, "following"))
+        self.stdout.write(self.style.SUCCESS(f"Recounted {posts} posts and {users} users"))
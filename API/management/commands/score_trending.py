@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from API.trending import refresh
+
+
+class Command(BaseCommand):
+    help = ("Rescore the explore feed: recent posts and those with likes or comments since the last run, "
+            "or every post with --full")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rescore every post")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Posts rescored per update")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rescored = refresh(options["batch_size"], options["full"])
+        self.stdout.write(self.style.SUCCESS(f"Rescored {rescored} posts in {time.perf_counter() - start:.1f}s"))
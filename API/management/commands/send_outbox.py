@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from API.outbox import deliver
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox emails in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument("--interval", type=float, default=5,
+                            help="Seconds to sleep when the outbox is empty")
+        parser.add_argument("--once", action="store_true", help="Drain the outbox once and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = deliver(options["batch_size"])
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} emails, {failed} failed")
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
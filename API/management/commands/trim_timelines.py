@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from API.models import TimelineEntry
+from API import timeline
+
+
+class Command(BaseCommand):
+    help = "Drop the timeline entries past the newest TIMELINE_MAX_ENTRIES of every user"
+
+    def handle(self, *args, **options):
+        full = (TimelineEntry.objects.values("user").annotate(entries=Count("id"))
+                .filter(entries__gt=settings.TIMELINE_MAX_ENTRIES).values_list("user", flat=True))
+        users = deleted = 0
+        # Collected first, SQLite cannot delete from the table under an open cursor on it
+        for user_id in list(full):
+            deleted += timeline.trim(user_id)
+            users += 1
+        self.stdout.write(self.style.SUCCESS(f"Trimmed {deleted} entries from {users} timelines"))
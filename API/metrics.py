@@ -0,0 +1,158 @@
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db import connections
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Prometheus histogram kept in process memory, one series per label set"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+        for labels, counts, total in sorted(series):
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+REQUEST_DURATION = Histogram("instapet_request_duration_seconds", "Time spent handling the request.",
+                             DURATION_BUCKETS)
+DB_DURATION = Histogram("instapet_db_duration_seconds", "Time spent in database queries per request.",
+                        DURATION_BUCKETS)
+DB_QUERIES = Histogram("instapet_db_queries", "Database queries per request.", QUERY_BUCKETS)
+SERIALIZER_DURATION = Histogram("instapet_serializer_duration_seconds",
+                                "Time spent serializing, database time excluded, per request.", DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram("instapet_response_size_bytes", "Size of the response body.", SIZE_BUCKETS)
+OVERHEAD = Histogram("instapet_metrics_overhead_seconds", "Time spent recording the request metrics.",
+                     DURATION_BUCKETS)
+HISTOGRAMS = (REQUEST_DURATION, DB_DURATION, DB_QUERIES, SERIALIZER_DURATION, RESPONSE_SIZE, OVERHEAD)
+
+
+def render():
+    """All metrics of this process in the Prometheus text format"""
+    return "\n".join(line for histogram in HISTOGRAMS for line in histogram.render()) + "\n"
+
+
+class RequestMetrics:
+    """Per request totals, also the execute_wrapper timing every query"""
+
+    def __init__(self, keep_queries=False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.span_depth = 0
+        self.timed_queries = [] if keep_queries else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            if self.timed_queries is not None:
+                self.timed_queries.append((elapsed, sql))
+
+    def record(self, view, method, status, total, size):
+        labels = (("view", view), ("method", method))
+        REQUEST_DURATION.observe((*labels, ("status", status)), total)
+        DB_DURATION.observe(labels, self.db_time)
+        DB_QUERIES.observe(labels, self.queries)
+        SERIALIZER_DURATION.observe(labels, self.serializer_time)
+        if size is not None:
+            RESPONSE_SIZE.observe(labels, size)
+
+    def server_timing(self, total):
+        return (f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries", '
+                f"serializer;dur={self.serializer_time * 1000:.2f}, total;dur={total * 1000:.2f}")
+
+
+current = ContextVar("request_metrics", default=None)
+
+
+def count_queries(request_metrics):
+    """Wraps the current thread's connections so their queries count into `request_metrics`"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(request_metrics))
+    return stack
+
+
+@contextmanager
+def measuring(request_metrics):
+    """Count the enclosed queries and serializer time of this thread into `request_metrics`, if any"""
+    if request_metrics is None:
+        yield
+        return
+    token = current.set(request_metrics)
+    try:
+        with count_queries(request_metrics):
+            yield
+    finally:
+        current.reset(token)
+
+
+@contextmanager
+def serializing():
+    """Count the enclosed time, minus its queries, as serializer time of the current request"""
+    metrics = current.get()
+    if metrics is None or metrics.span_depth:
+        # Nested serializers are already inside the outermost span
+        yield
+        return
+    metrics.span_depth += 1
+    start, db_start = time.perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics.span_depth -= 1
+        metrics.serializer_time += time.perf_counter() - start - (metrics.db_time - db_start)
+
+
+def timed_serialization(method):
+    """Decorator form of serializing() for sync and async methods"""
+    if inspect.iscoroutinefunction(method):
+        @wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            with serializing():
+                return await method(*args, **kwargs)
+        return async_wrapper
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with serializing():
+            return method(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,144 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from . import metrics
+from .routers import begin_request, end_request
+
+logger = logging.getLogger(__name__)
+
+
+def pin_key(user_id):
+    return f"db:pin:{user_id}"
+
+
+class ReplicaPinMiddleware:
+    """Keeps a user's reads on the primary for REPLICA_PIN_SECONDS after a request of theirs wrote"""
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.authentication = JWTAuthentication()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def token_user_id(self, request):
+        header = self.authentication.get_header(request)
+        raw_token = self.authentication.get_raw_token(header) if header else None
+        if raw_token is None:
+            return None
+        try:
+            return self.authentication.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+        except InvalidToken:
+            return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user_id = self.token_user_id(request)
+        token = begin_request(bool(user_id) and cache.get(pin_key(user_id)) is not None)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = end_request(token)
+        # Set before the response leaves so the client's next request already sees it
+        if user_id and state.wrote:
+            cache.set(pin_key(user_id), True, timeout=settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        user_id = self.token_user_id(request)
+        token = begin_request(bool(user_id) and await cache.aget(pin_key(user_id)) is not None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = end_request(token)
+        if user_id and state.wrote:
+            await cache.aset(pin_key(user_id), True, timeout=settings.REPLICA_PIN_SECONDS)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Records the queries and their time, serializer time, total time and response size of each request
+    by URL name, as a Server-Timing header and in the histograms served by the metrics endpoint.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        request_metrics = metrics.RequestMetrics(keep_queries=bool(settings.SLOW_REQUEST_MS))
+        with metrics.measuring(request_metrics):
+            response = self.get_response(request)
+        return self.finish(request, request_metrics, start, response)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        request_metrics = metrics.RequestMetrics(keep_queries=bool(settings.SLOW_REQUEST_MS))
+        token = metrics.current.set(request_metrics)
+        try:
+            # Connections belong to threads and the request's ORM calls all run in the thread
+            # sync_to_async gives it, so that thread's connections are the ones to wrap
+            wrapped = await sync_to_async(metrics.count_queries)(request_metrics)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(wrapped.close)()
+        finally:
+            metrics.current.reset(token)
+        return self.finish(request, request_metrics, start, response)
+
+    def finish(self, request, request_metrics, start, response):
+        recording_start = time.perf_counter()
+        match = request.resolver_match
+        view = match.url_name or match.view_name if match else "unmatched"
+        # Sent before any streamed content, so only up to here
+        response["Server-Timing"] = request_metrics.server_timing(recording_start - start)
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.record_streamed(request, view, request_metrics, start,
+                                                              response.status_code, response.streaming_content)
+        else:
+            size = len(response.content) if not response.streaming else None
+            self.record(request, view, request_metrics, start, response.status_code, size)
+        metrics.OVERHEAD.observe((("view", view),), time.perf_counter() - recording_start)
+        return response
+
+    def record_streamed(self, request, view, request_metrics, start, status_code, content):
+        """Pass `content` through and record the request once it is sent, with its queries and size"""
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, view, request_metrics, start, status_code, size)
+
+    def record(self, request, view, request_metrics, start, status_code, size):
+        total = time.perf_counter() - start
+        request_metrics.record(view, request.method, str(status_code), total, size)
+        if settings.SLOW_REQUEST_MS and total * 1000 >= settings.SLOW_REQUEST_MS:
+            self.log_slow(request, view, request_metrics, total)
+
+    def log_slow(self, request, view, request_metrics, total):
+        slowest = sorted(request_metrics.timed_queries, key=lambda query: query[0], reverse=True)
+        lines = [f"{elapsed * 1000:8.2f} ms  {sql}" for elapsed, sql in slowest[:settings.SLOW_REQUEST_TOP_QUERIES]]
+        logger.warning("Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms\n%s",
+                       request.method, request.path, view, total * 1000, request_metrics.queries,
+                       request_metrics.db_time * 1000, "\n".join(lines))
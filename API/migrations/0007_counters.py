@@ -0,0 +1,55 @@
+# Generated by Django 5.1.1 on 2026-10-17 18:49
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    """Count the existing rows, as the recount command does"""
+    User = apps.get_model("API", "User")
+    Post = apps.get_model("API", "Post")
+    Comment = apps.get_model("API", "Comment")
+    Like = apps.get_model("API", "Like")
+    Follow = apps.get_model("API", "Follow")
+
+    def count_of(model, field):
+        # Kept here so later changes to the app's helpers do not change this migration
+        rows = (model.objects.filter(**{field: OuterRef("pk")}).order_by()
+                .values(field).annotate(total=Count("pk")).values("total"))
+        return Coalesce(Subquery(rows), 0)
+
+    Post.objects.update(like_count=count_of(Like, "post"), comment_count=count_of(Comment, "post"))
+    User.objects.update(follower_count=count_of(Follow, "followed"),
+                        following_count=count_of(Follow, "following"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0006_post_ordering_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
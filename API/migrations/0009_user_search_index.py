@@ -0,0 +1,61 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE "API_user_search" USING fts5(
+        username, bio, content='API_user', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER "API_user_search_ai" AFTER INSERT ON "API_user" BEGIN
+        INSERT INTO "API_user_search"(rowid, username, bio) VALUES (new.id, new.username, new.bio);
+    END""",
+    """CREATE TRIGGER "API_user_search_ad" AFTER DELETE ON "API_user" BEGIN
+        INSERT INTO "API_user_search"("API_user_search", rowid, username, bio)
+        VALUES ('delete', old.id, old.username, old.bio);
+    END""",
+    """CREATE TRIGGER "API_user_search_au" AFTER UPDATE OF username, bio ON "API_user" BEGIN
+        INSERT INTO "API_user_search"("API_user_search", rowid, username, bio)
+        VALUES ('delete', old.id, old.username, old.bio);
+        INSERT INTO "API_user_search"(rowid, username, bio) VALUES (new.id, new.username, new.bio);
+    END""",
+    """INSERT INTO "API_user_search"("API_user_search") VALUES ('rebuild')""",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS "API_user_search_au"',
+    'DROP TRIGGER IF EXISTS "API_user_search_ad"',
+    'DROP TRIGGER IF EXISTS "API_user_search_ai"',
+    'DROP TABLE IF EXISTS "API_user_search"',
+]
+
+# Django compiles icontains to UPPER(col) LIKE UPPER(%s), which these indexes serve
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX IF NOT EXISTS "API_user_username_trgm" ON "API_user" USING gin (UPPER("username") gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS "API_user_bio_trgm" ON "API_user" USING gin (UPPER("bio") gin_trgm_ops)',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS "API_user_bio_trgm"',
+    'DROP INDEX IF EXISTS "API_user_username_trgm"',
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0008_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            run({"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-17 18:53
+
+from django.db import migrations
+from django.db.models import Min, Count
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    """Keep the earliest like of each (post, owner) pair so the constraint can be added"""
+    Like = apps.get_model("API", "Like")
+    duplicates = (Like.objects.values("post", "owner").order_by()
+                  .annotate(first_id=Min("id"), total=Count("id")).filter(total__gt=1))
+    for row in duplicates:
+        Like.objects.filter(post=row["post"], owner=row["owner"]).exclude(id=row["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0009_user_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='like',
+            unique_together={('post', 'owner')},
+        ),
+    ]
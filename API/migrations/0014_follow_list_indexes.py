@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-17 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0013_comment_preview_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['followed', 'created_at', 'id'], name='follow_followed_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', 'created_at', 'id'], name='follow_following_created_idx'),
+        ),
+    ]
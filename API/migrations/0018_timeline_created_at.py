@@ -0,0 +1,47 @@
+# Generated by Django 5.1.1 on 2026-10-17 19:56
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery
+
+
+def copy_post_times(apps, schema_editor):
+    """Date existing entries by their post, and flag the posts of authors under the fan-out limit as pushed"""
+    User = apps.get_model("API", "User")
+    Post = apps.get_model("API", "Post")
+    TimelineEntry = apps.get_model("API", "TimelineEntry")
+    TimelineEntry.objects.update(
+        created_at=Subquery(Post.objects.filter(id=OuterRef("post_id")).values("created_at")[:1]))
+    pushed = User.objects.filter(id=OuterRef("owner_id"), follower_count__lte=settings.FANOUT_MAX_FOLLOWERS)
+    Post.objects.update(fanned_out=Exists(pushed))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0017_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='fanned_out',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_post_times, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['owner', 'created_at', 'id'], name='post_pulled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_created_idx'),
+        ),
+    ]
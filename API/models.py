@@ -1,7 +1,37 @@
+from django.conf import settings
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.db.models.functions import Lower, RowNumber
+from django.utils import timezone
+from django.contrib.auth.models import AbstractUser, UserManager
 from cloudinary.models import CloudinaryField
 
+class TombstoneManager(models.Manager):
+    """
+    Leaves out rows whose `tombstones`, the deleted_at of the row itself or of the user
+    or post it belongs to, are set. Tombstoned rows are deleted later by the reaper.
+    """
+    tombstones = ()
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**{f"{field}__isnull": True for field in self.tombstones})
+
+
+class LiveUserManager(TombstoneManager, UserManager):
+    tombstones = ("deleted_at",)
+
+
+class LivePostManager(TombstoneManager):
+    tombstones = ("deleted_at", "owner__deleted_at")
+
+
+class LiveActivityManager(TombstoneManager):
+    tombstones = ("post__deleted_at", "owner__deleted_at")
+
+
+class LiveFollowManager(TombstoneManager):
+    tombstones = ("followed__deleted_at", "following__deleted_at")
+
+
 # Create your models here.
 class User(AbstractUser):
     username = models.CharField(max_length=100, unique=True, db_index=True)
@@ -10,37 +40,98 @@ class User(AbstractUser):
     gender = models.CharField(max_length=20, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     avatar = CloudinaryField("Image", overwrite=True, format="jpg")
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveUserManager()
+    all_objects = UserManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["deleted_at"], name="user_deleted_idx", condition=models.Q(deleted_at__isnull=False)),
+            models.Index(Lower("username"), name="user_username_lower_idx"),
+        ]
+
     
     def __str__(self):
         return self.username
     
 
+class PostQuerySet(models.QuerySet):
+    def with_details(self):
+        """Fetch everything PostSerializer renders in a fixed number of queries"""
+        return self.select_related("owner").prefetch_related(
+            models.Prefetch("comments", to_attr="comment_preview",
+                            queryset=Comment.objects.latest_per_post().select_related("owner")),
+            "likes",
+        )
+
+
 class Post(models.Model):
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+    STATUSES = [(PROCESSING, "Processing"), (READY, "Ready"), (FAILED, "Failed")]
+
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     image = CloudinaryField("Image", overwrite=True, format="jpg")
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
+    status = models.CharField(max_length=10, choices=STATUSES, default=READY)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    trending_score = models.FloatField(default=0)
+    scored_at = models.DateTimeField(null=True, blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Pushed into the followers' timelines, otherwise pulled into their feeds at read time
+    fanned_out = models.BooleanField(default=False)
+
+    objects = LivePostManager.from_queryset(PostQuerySet)()
+    all_objects = PostQuerySet.as_manager()
 
     class Meta:
-        ordering =["-created_at"]
+        ordering =["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["owner", "created_at"], name="post_owner_created_idx"),
+            models.Index(fields=["created_at", "id"], name="post_created_idx"),
+            models.Index(fields=["trending_score", "id"], name="post_trending_idx"),
+            models.Index(fields=["scored_at"], name="post_scored_idx"),
+            models.Index(fields=["deleted_at"], name="post_deleted_idx", condition=models.Q(deleted_at__isnull=False)),
+            models.Index(fields=["owner", "created_at", "id"], name="post_pulled_idx",
+                         condition=models.Q(fanned_out=False)),
+        ]
 
     
     def __str__(self):
         return self.message
     
 
+class CommentQuerySet(models.QuerySet):
+    def latest_per_post(self, size=None):
+        """The `size` newest comments of each post, COMMENT_PREVIEW_SIZE by default, in one windowed query"""
+        rank = models.Window(RowNumber(), partition_by="post_id", order_by=("-created_at", "-id"))
+        return self.alias(rank=rank).filter(rank__lte=size or settings.COMMENT_PREVIEW_SIZE)
+
+
 class Comment(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
 
+    objects = LiveActivityManager.from_queryset(CommentQuerySet)()
+    all_objects = CommentQuerySet.as_manager()
+
     class Meta:
-        ordering = ["-created_at"]
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["post", "created_at", "id"], name="comment_post_created_idx"),
+            models.Index(fields=["created_at"], name="comment_created_idx"),
+        ]
 
 
     def __str__(self):
@@ -52,11 +143,101 @@ class Like(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="likes")
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="likes")
 
+    objects = LiveActivityManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        unique_together = ("post", "owner")
+        indexes = [
+            models.Index(fields=["created_at"], name="like_created_idx"),
+        ]
+
 
 class Follow(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     followed = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followers")
     following = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followings")
 
+    objects = LiveFollowManager()
+    all_objects = models.Manager()
+
     class Meta:
-        unique_together = ("followed", "following")
\ No newline at end of file
+        unique_together = ("followed", "following")
+        indexes = [
+            models.Index(fields=["followed", "created_at", "id"], name="follow_followed_created_idx"),
+            models.Index(fields=["following", "created_at", "id"], name="follow_following_created_idx"),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """A post pushed into a follower's feed when it was created (fan-out on write)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    # The post's, so a feed page is cut from this table before any post is read
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-post"], name="timeline_user_created_idx"),
+        ]
+
+
+class Suggestion(models.Model):
+    """An account to follow, ranked per user by the compute_suggestions batch job"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="suggestions")
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ("user", "rank")
+
+
+class OutboxEmail(models.Model):
+    """An email queued by a request and delivered later by the send_outbox worker"""
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUSES = [(PENDING, "Pending"), (SENT, "Sent"), (FAILED, "Failed")]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    recipient = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx")]
+
+    def __str__(self):
+        return self.subject
+
+
+class PendingUpload(models.Model):
+    """A file staged on local disk waiting for the process_uploads worker to store it"""
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [(PENDING, "Pending"), (DONE, "Done"), (FAILED, "Failed")]
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, related_name="uploads")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name="uploads")
+    field = models.CharField(max_length=50)
+    path = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="upload_due_idx")]
+
+    @property
+    def target(self):
+        return self.post if self.post_id else self.user
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxEmail
+
+
+def claim(batch_size):
+    """Lease a batch of due emails so concurrent workers do not send them twice"""
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(OutboxEmail.objects.select_for_update(skip_locked=True)
+                      .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+                      .order_by("next_attempt_at")[:batch_size])
+        OutboxEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS))
+    return emails
+
+
+def _sent(email):
+    email.status = OutboxEmail.SENT
+    email.sent_at = timezone.now()
+    email.save(update_fields=["status", "sent_at"])
+
+
+def _failed(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboxEmail.FAILED
+    else:
+        delay = settings.OUTBOX_BACKOFF_SECONDS * 2 ** email.attempts
+        email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    email.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def deliver(batch_size=None):
+    """Send one batch of due emails over a single connection, returns (sent, failed)"""
+    emails = claim(batch_size or settings.OUTBOX_BATCH_SIZE)
+    if not emails:
+        return 0, 0
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        for email in emails:
+            _failed(email, error)
+        return 0, len(emails)
+    try:
+        for email in emails:
+            message = EmailMessage(subject=email.subject, body=email.body,
+                                   to=[email.recipient], connection=connection)
+            try:
+                message.send()
+            except Exception as error:
+                _failed(email, error)
+                failed += 1
+            else:
+                _sent(email)
+                sent += 1
+    finally:
+        connection.close()
+    return sent, failed
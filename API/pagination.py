@@ -0,0 +1,181 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the values of the last row of a page.
+    `ordering` must end in a unique field so every row has a distinct position,
+    which keeps the cost of a page independent of how deep it is.
+    """
+    ordering = ("-created_at", "-id")
+    page_size = settings.PAGE_SIZE
+    max_page_size = settings.MAX_PAGE_SIZE
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        self.limit = self.get_page_size(request)
+        # Fetch one extra row to know whether there is a next page
+        return self.get_ordered_queryset(queryset, request)[:self.limit + 1]
+
+    def get_ordered_queryset(self, queryset, request):
+        """Every row from the requested cursor on, in page order"""
+        self.request = request
+        self.model = queryset.model
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+        return queryset
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.limit
+        self.page = results[:self.limit]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_keyset_filter(self, position):
+        """Rows strictly after `position` in `ordering`, e.g. (a < x) OR (a = x AND b < y)"""
+        condition = Q()
+        tied = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= tied & Q(**{f"{name}__{lookup}": value})
+            tied &= Q(**{name: value})
+        return condition
+
+    def get_fields(self):
+        return [self.model._meta.get_field(field.lstrip("-")) for field in self.ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            fields = self.get_fields()
+            if not isinstance(raw, list) or len(raw) != len(fields):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(fields, raw)]
+            # None is no position in the ordering and cannot be compared against
+            if any(value is None for value in position):
+                raise ValueError
+            return position
+        except (binascii.Error, UnicodeError, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_position_value(self, obj, field):
+        # Pages may hold model instances or values() dicts
+        value = obj[field.attname] if isinstance(obj, dict) else getattr(obj, field.attname)
+        return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+    def encode_cursor(self, obj):
+        position = [self.get_position_value(obj, field) for field in self.get_fields()]
+        return base64.urlsafe_b64encode(json.dumps(position).encode("ascii")).decode("ascii")
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_data(self, data):
+        return {"next": self.get_next_link(), "results": data}
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class TimelinePagination(KeysetPagination):
+    """Timeline entries keyed on their copy of the post's (created_at, id), as feed cursors are"""
+    ordering = ("-created_at", "-post_id")
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Newest-first feed pages keyed on (created_at, id). A page is cut from the user's
+    timeline entries and the posts pulled at read time, each read in index order from
+    the cursor on, before its posts are fetched by id.
+    """
+    page_size = settings.FEED_PAGE_SIZE
+
+    def get_sources(self, inbox, pulled, request):
+        """(created_at, post id) querysets of both sources, one page each from the cursor on"""
+        self.limit = self.get_page_size(request)
+        inbox = TimelinePagination().get_ordered_queryset(inbox, request)
+        pulled = self.get_ordered_queryset(pulled, request)
+        return (inbox.values_list("created_at", "post_id")[:self.limit + 1],
+                pulled.values_list("created_at", "id")[:self.limit + 1])
+
+    def get_page_ids(self, positions):
+        # A post pulled while it was being fanned out comes from both sources
+        return [post_id for _, post_id in sorted(set(positions), reverse=True)[:self.limit + 1]]
+
+    def set_feed_page(self, ids, rows):
+        rows = {row["id"]: row for row in rows}
+        return self.set_page([rows[post_id] for post_id in ids if post_id in rows])
+
+    def paginate_feed(self, posts, inbox, pulled, request):
+        """The page of `posts`, values() rows of any posts, that the two sources point at"""
+        ids = self.get_page_ids([position for source in self.get_sources(inbox, pulled, request)
+                                 for position in source])
+        return self.set_feed_page(ids, posts.filter(id__in=ids))
+
+    async def apaginate_feed(self, posts, inbox, pulled, request):
+        ids = self.get_page_ids([position for source in self.get_sources(inbox, pulled, request)
+                                 async for position in source])
+        return self.set_feed_page(ids, [row async for row in posts.filter(id__in=ids)])
+
+
+class TrendingPagination(KeysetPagination):
+    """Explore pages, highest trending score first, keyed on (trending_score, id)"""
+    ordering = ("-trending_score", "-id")
+    page_size = settings.FEED_PAGE_SIZE
+
+
+class CommentPagination(KeysetPagination):
+    """Newest-first comments of a post keyed on (created_at, id)"""
+    page_size = settings.COMMENT_PAGE_SIZE
+
+
+class SearchPagination(LimitOffsetPagination):
+    """Small bounded pages for ranked typeahead results"""
+    default_limit = settings.SEARCH_PAGE_SIZE
+    max_limit = settings.MAX_PAGE_SIZE
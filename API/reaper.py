@@ -0,0 +1,143 @@
+"""
+Soft deletion. tombstone() hides a user or post at once by setting its deleted_at, which
+the default managers filter on, and the reaper deletes it later: its dependents first, a
+chunk of primary keys per short transaction, then the row itself. All progress lives in
+the tables, so an interrupted run is resumed by starting it again.
+"""
+import time
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+from .cache import bump_versions, invalidate_profiles
+from .models import User, Post, Comment, Like, Follow, TimelineEntry, Suggestion
+from .utils import count_of
+
+# Rows hanging off a post, as (model, field pointing at the post)
+POST_DEPENDENTS = (
+    (TimelineEntry, "post"),
+    (Like, "post"),
+    (Comment, "post"),
+)
+
+# Rows hanging off a user besides their posts, as (model, field pointing at the user,
+# field pointing at the row whose counter of these rows is recounted)
+USER_DEPENDENTS = (
+    (TimelineEntry, "user", None),
+    (Suggestion, "user", None),
+    (Suggestion, "suggested", None),
+    (Like, "owner", "post"),
+    (Comment, "owner", "post"),
+    (Follow, "following", "followed"),
+    (Follow, "followed", "following"),
+)
+
+COUNTERS = {
+    (Like, "post"): "like_count",
+    (Comment, "post"): "comment_count",
+    (Follow, "followed"): "follower_count",
+    (Follow, "following"): "following_count",
+}
+
+
+def tombstone(instance):
+    """Hide a user or post right away and leave its deletion to the reaper"""
+    instance.deleted_at = timezone.now()
+    fields = ["deleted_at"]
+    if isinstance(instance, User):
+        instance.is_active = False
+        fields.append("is_active")
+    # Saving sends the signals that drop the cached profiles and versions showing it
+    instance.save(update_fields=fields)
+
+
+def delete_rows(model, pks):
+    """
+    DELETE the rows of `model` with primary keys `pks` in one statement. Not QuerySet.delete(),
+    which sends the post_delete signals of every row, invalidating the same caches once per row
+    instead of once per chunk, and nothing cascades from the models reaped in chunks anyway.
+    """
+    if not pks:
+        return
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} "
+                       f"IN ({placeholders})", pks)
+
+
+class Reaper:
+    """Deletes tombstoned posts and users, calling report(message) after every chunk"""
+
+    def __init__(self, chunk_size, pause=0, report=None):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.report = report or (lambda message: None)
+
+    def delete_chunk(self, model, counted, lookup):
+        """
+        Delete up to chunk_size rows of `model` matching `lookup` in one transaction and
+        recount the counter of the rows their `counted` field points at.
+        """
+        with transaction.atomic():
+            chunk = list(model._base_manager.filter(**lookup).order_by("pk")
+                         .values_list("pk", *([f"{counted}_id"] if counted else []))[:self.chunk_size])
+            delete_rows(model, [row[0] for row in chunk])
+            affected = {row[1] for row in chunk} if counted else set()
+            target = model._meta.get_field(counted).related_model if counted else None
+            if affected:
+                target._base_manager.filter(id__in=affected).update(
+                    **{COUNTERS[model, counted]: count_of(model, counted)})
+        if target is Post:
+            bump_versions("post", affected)
+            invalidate_profiles(*Post.all_objects.filter(id__in=affected).values_list("owner_id", flat=True))
+        elif target is User:
+            invalidate_profiles(*affected)
+        return len(chunk)
+
+    def drain(self, label, model, lookup, counted=None):
+        """Delete every `model` row matching `lookup`, returns how many"""
+        total = 0
+        while True:
+            deleted = self.delete_chunk(model, counted, lookup)
+            if not deleted:
+                return total
+            total += deleted
+            self.report(f"{label}: {total} {model.__name__} rows deleted")
+            time.sleep(self.pause)
+
+    def reap_post(self, post_id, label=None):
+        label = label or f"post {post_id}"
+        deleted = sum(self.drain(label, model, {field: post_id}) for model, field in POST_DEPENDENTS)
+        Post.all_objects.filter(id=post_id).delete()
+        return deleted + 1
+
+    def reap_user(self, user_id):
+        label = f"user {user_id}"
+        deleted = 0
+        while True:
+            # The first remaining post each time, the ones before it are gone
+            post_id = Post.all_objects.filter(owner=user_id).order_by("id").values_list("id", flat=True).first()
+            if post_id is None:
+                break
+            deleted += self.reap_post(post_id, f"{label}, post {post_id}")
+        for model, field, counted in USER_DEPENDENTS:
+            deleted += self.drain(label, model, {field: user_id}, counted)
+        User.all_objects.filter(id=user_id).delete()
+        return deleted + 1
+
+    def reap_all(self, model, reap):
+        """Reap every tombstoned row of `model`, returns how many and the rows deleted with them"""
+        reaped = rows = 0
+        while True:
+            pk = model.all_objects.filter(deleted_at__isnull=False).order_by("id").values_list("id", flat=True).first()
+            if pk is None:
+                return reaped, rows
+            rows += reap(pk)
+            reaped += 1
+
+    def run(self):
+        """Reap every tombstoned post, then every tombstoned user. Returns (posts, users, rows deleted)"""
+        posts, post_rows = self.reap_all(Post, self.reap_post)
+        users, user_rows = self.reap_all(User, self.reap_user)
+        return posts, users, post_rows + user_rows
@@ -0,0 +1,75 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class RoutingState:
+    """Whether the current request has to read from the primary"""
+
+    def __init__(self, pinned=False, alias=None):
+        self.pinned = pinned
+        self.wrote = False
+        # Where every read goes, for reads made after their request has returned
+        self.alias = alias
+
+
+_state = ContextVar("replica_routing", default=None)
+
+
+def begin_request(pinned):
+    return _state.set(RoutingState(pinned))
+
+
+def end_request(token):
+    """Stop routing for the request and return its state"""
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+@contextmanager
+def reading_from(alias):
+    """Send the enclosed reads to `alias`, e.g. those of a response streamed after its request"""
+    token = _state.set(RoutingState(alias=alias))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of requests to a random replica and writes to the primary.
+    Reads stay on the primary inside transactions, after a write in the same request,
+    while the user is pinned by ReplicaPinMiddleware and outside requests, where workers
+    and commands read what they are about to write.
+    """
+
+    def __init__(self):
+        self.replicas = [alias for alias in connections if alias != DEFAULT_DB_ALIAS]
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.alias is not None:
+            return state.alias
+        if not self.replicas or state is None or state.pinned or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,41 @@
+from django.db import connection
+from django.db.models import Case, When, Value, IntegerField, Q
+from django.db.models.expressions import RawSQL
+from .models import User
+
+# Trigram indexes cannot match fewer than three characters
+MIN_TRIGRAM_LENGTH = 3
+
+
+def _fts_match(query, include_bio):
+    columns = "{username bio}" if include_bio else "username"
+    phrase = query.replace('"', '""')
+    return RawSQL('SELECT rowid FROM "API_user_search" WHERE "API_user_search" MATCH %s',
+                  [f'{columns} : "{phrase}"'])
+
+
+def _matches(query, include_bio):
+    if connection.vendor == "sqlite" and len(query) >= MIN_TRIGRAM_LENGTH:
+        return Q(id__in=_fts_match(query, include_bio))
+    # Served by the pg_trgm indexes on Postgres. Shorter queries still match anywhere in
+    # the username, as before the indexes, by scanning
+    condition = Q(username__icontains=query)
+    if include_bio:
+        condition |= Q(bio__icontains=query)
+    return condition
+
+
+def search_users(query, include_bio=False):
+    """Users matching `query`, exact username first, then prefix matches, then the rest"""
+    query = query.strip()
+    if not query:
+        return User.objects.order_by("id")
+    rank = Case(
+        When(username__iexact=query, then=Value(0)),
+        When(username__istartswith=query, then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+    return (User.objects.filter(_matches(query, include_bio))
+            .annotate(rank=rank)
+            .order_by("rank", "-follower_count", "id"))
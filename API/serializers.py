@@ -1,20 +1,90 @@
 from rest_framework import serializers
-from .models import User, Post, Comment, Like, Follow
-from django.template.defaultfilters import timesince_filter
+from django.conf import settings
+from .models import User, Post, Comment, Like, Follow, Suggestion
+from django.utils import timezone
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from .blacklist import FilteredRefreshToken
+from .projections import compact_age
+from .metrics import serializing
 
 
-class SimpleUserSerializer(serializers.ModelSerializer):
+def query_flag(context, name):
+    request = context.get("request")
+    if request is None:
+        return False
+    return request.query_params.get(name, "").lower() in ("1", "true")
+
+
+def is_compact(context):
+    """Whether the request asked for counts instead of embedded lists (?compact=true)"""
+    return query_flag(context, "compact")
+
+
+def is_expanded(context):
+    """Whether the request asked for the profile with its posts and follows embedded (?expand=true)"""
+    return query_flag(context, "expand")
+
+
+def is_streamed(context):
+    """Whether the request asked for the whole list as one streamed JSON array (?stream=true)"""
+    return query_flag(context, "stream")
+
+
+def profile_variant(context):
+    """Name of the profile shape the request asked for, used in cache keys and ETags"""
+    if not is_expanded(context):
+        return "summary"
+    return "compact" if is_compact(context) else "full"
+
+
+class CompactMixin:
+    """Replaces the list fields in `compact_fields` with their counter columns in compact mode"""
+    compact_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not is_compact(self.context):
+            return fields
+        compacted = {}
+        for name, field in fields.items():
+            if name in self.compact_fields:
+                compacted[self.compact_fields[name]] = serializers.IntegerField(read_only=True)
+            else:
+                compacted[name] = field
+        return compacted
+
+
+class UpdateFieldsMixin:
+    """Saves only the written fields so concurrent F() counter updates are not overwritten"""
+
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+
+class TimedMixin:
+    """Counts rendering time as serializer time in the request metrics"""
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
+
+
+class SimpleUserSerializer(TimedMixin, serializers.ModelSerializer):
     """Simple User serializer to be used in the Post serializer to return the post owners"""
     class Meta:
         model = User
         fields = ["id", "username", "email", "bio", "avatar", "gender"]
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedMixin, serializers.ModelSerializer):
     owner = SimpleUserSerializer(read_only=True)
     age = serializers.SerializerMethodField(method_name="get_comment_age")
     class Meta:
@@ -23,39 +93,41 @@ class CommentSerializer(serializers.ModelSerializer):
 
     def get_comment_age(self, comment: Comment):
         """Time Since the post was created"""
-        timeIsince = timesince_filter(comment.created_at)
-        left = timeIsince.split(",")[0]
-        number = left.split()[0]
-        time = left.split()[1][0]
-        return f"{number}{time}"
+        return compact_age(comment.created_at, self.context.get("now") or timezone.now())
 
 
-class LikeSerializer(serializers.ModelSerializer):
+class LikeSerializer(TimedMixin, serializers.ModelSerializer):
     class Meta:
         model = Like
         fields = ("id", "created_at", "owner")
         extra_kwargs = {"owner": {"read_only": True}}
 
 
-class PostSerializer(serializers.ModelSerializer):
-    comments = CommentSerializer(many=True, read_only=True)
+class PostSerializer(TimedMixin, CompactMixin, UpdateFieldsMixin, serializers.ModelSerializer):
+    compact_fields = {"comments": "comment_count", "likes": "like_count"}
+    comments = serializers.SerializerMethodField(method_name="get_comment_preview")
     likes = LikeSerializer(many=True, read_only=True)
     age = serializers.SerializerMethodField(method_name="get_post_age")
     owner = SimpleUserSerializer(read_only=True)
     class Meta:
         model = Post
-        fields = ["id", "message", "created_at", "image", "comments", "likes", "age", "owner"]
+        fields = ["id", "message", "created_at", "image", "status", "comments", "comment_count", "likes", "age",
+                  "owner"]
+        extra_kwargs = {"status": {"read_only": True}, "comment_count": {"read_only": True}}
+
+    def get_comment_preview(self, post: Post):
+        """The newest COMMENT_PREVIEW_SIZE comments, prefetched for the whole page by with_details()"""
+        preview = getattr(post, "comment_preview", None)
+        if preview is None:
+            preview = post.comments.select_related("owner")[:settings.COMMENT_PREVIEW_SIZE]
+        return CommentSerializer(preview, many=True, context=self.context).data
 
     def get_post_age(self, post: Post):
         """Time Since the post was created"""
-        timeIsince = timesince_filter(post.created_at)
-        left = timeIsince.split(",")[0]
-        number = left.split()[0]
-        time = left.split()[1][0]
-        return f"{number}{time}"
+        return compact_age(post.created_at, self.context.get("now") or timezone.now())
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(TimedMixin, serializers.ModelSerializer):
     followers = SimpleUserSerializer(read_only=True)
     following = SimpleUserSerializer(read_only=True)
     class Meta:
@@ -64,7 +136,8 @@ class FollowSerializer(serializers.ModelSerializer):
     
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedMixin, CompactMixin, serializers.ModelSerializer):
+    compact_fields = {"followings": "following_count", "followers": "follower_count"}
     posts = PostSerializer(many=True, read_only=True)
     followings = FollowSerializer(many=True, read_only=True)
     followers = FollowSerializer(many=True, read_only=True)
@@ -76,7 +149,12 @@ class UserSerializer(serializers.ModelSerializer):
             "followings": {"read_only": True},
             "followers": {"read_only": True},
             "bio": {"required": False},
-            "avatar": {"required": False}
+            "avatar": {"required": False},
+            # Tombstoned users keep their email and username until they are reaped
+            "email": {"validators": [UniqueValidator(User.all_objects.all(),
+                                                     message="user with this email already exists.")]},
+            "username": {"validators": [UniqueValidator(User.all_objects.all(),
+                                                        message="user with this username already exists.")]},
         }
 
     def create(self, validated_data):
@@ -84,6 +162,20 @@ class UserSerializer(serializers.ModelSerializer):
         return user
     
 
+class ProfileSerializer(TimedMixin, serializers.ModelSerializer):
+    """Profile without embedded lists, those are paged from user/<pk>/posts, /followers and /following"""
+    class Meta:
+        model = User
+        fields = ["id", "username", "email", "bio", "avatar", "gender", "follower_count", "following_count"]
+
+
+class SuggestionSerializer(TimedMixin, serializers.ModelSerializer):
+    user = SimpleUserSerializer(source="suggested", read_only=True)
+    class Meta:
+        model = Suggestion
+        fields = ("user", "score")
+
+
 class UpdateUserSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(required=True)
     class Meta:
@@ -92,13 +184,13 @@ class UpdateUserSerializer(serializers.ModelSerializer):
     
     def validate_email(self, value):
         user = self.context["request"].user
-        if User.objects.exclude(id=user.id).filter(email=value).exists():
+        if User.all_objects.exclude(id=user.id).filter(email=value).exists():
             raise serializers.ValidationError({"email": "This email is already in use"})
         return value
     
     def validate_username(self, value):
         user =self.context["request"].user
-        if User.objects.exclude(id=user.id).filter(username=value).exists():
+        if User.all_objects.exclude(id=user.id).filter(username=value).exists():
             raise serializers.ValidationError({"username": "Username is taken"})
         return value
         
@@ -108,16 +200,21 @@ class UpdateUserSerializer(serializers.ModelSerializer):
         instance.email = validated_data["email"]
         instance.gender = validated_data["gender"]
 
-        instance.save()
+        instance.save(update_fields=["bio", "username", "email", "gender"])
         return instance
 
 
-class UpdateAvatarSerializer(serializers.ModelSerializer):
+class UpdateAvatarSerializer(UpdateFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["avatar"]
 
 
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                max_length=settings.MAX_BATCH_SIZE)
+
+
 class ResetPasswordSerializer(serializers.Serializer):
     email = serializers.EmailField(min_length=2)
 
@@ -146,7 +243,7 @@ class NewPasswordSerializer(serializers.Serializer):
                 raise AuthenticationFailed("Reset link invalid", 401)
             
             user.set_password(password)
-            user.save()
+            user.save(update_fields=["password"])
 
             return user
 
@@ -154,4 +251,9 @@ class NewPasswordSerializer(serializers.Serializer):
             raise AuthenticationFailed("Reset link invalid", 401)
         
         return super().validate(attrs)
-        
\ No newline at end of file
+        
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that checks the blacklist through the in-process filter"""
+    token_class = FilteredRefreshToken
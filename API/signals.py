@@ -0,0 +1,51 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from .models import User, Post, Comment, Like, Follow
+from .cache import invalidate_profiles, bump_versions, invalidate_principal, SHOWN_USER
+from .blacklist import announce
+
+# User fields shown in their profile and, but for the counters, wherever else they are embedded
+PROFILE_FIELDS = {"username", "email", "bio", "avatar", "gender", "follower_count", "following_count",
+                  "deleted_at"}
+
+
+def post_owner(post_id):
+    return Post.all_objects.filter(id=post_id).values_list("owner_id", flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    invalidate_principal(instance.id)
+    # Saves of other fields, such as last_login, change nothing that is shown
+    if update_fields is not None and not PROFILE_FIELDS.intersection(update_fields):
+        return
+    invalidate_profiles(instance.id)
+    # Cached profiles and versions of posts showing the user check this version when read
+    bump_versions(SHOWN_USER, [instance.id])
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    invalidate_profiles(instance.owner_id)
+    bump_versions("post", [instance.id])
+
+
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Like)
+def post_activity_changed(sender, instance, **kwargs):
+    invalidate_profiles(post_owner(instance.post_id))
+    bump_versions("post", [instance.post_id])
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    invalidate_profiles(instance.followed_id, instance.following_id)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance, created, **kwargs):
+    if created:
+        jti = instance.token.jti
+        transaction.on_commit(lambda: announce(jti))
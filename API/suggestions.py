@@ -0,0 +1,99 @@
+"""
+Offline "who to follow" scores. The whole follow graph is loaded into CSR arrays,
+(indptr, indices) over dense user indexes in both directions, so a run reads the
+Follow table once and scores every user with array operations.
+"""
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from .models import Follow, Suggestion
+
+
+def csr(rows, columns, size):
+    """Adjacency lists of `size` nodes from edge arrays, as an (indptr, indices) pair"""
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, columns[order].astype(np.int32)
+
+
+def gather(indptr, indices, nodes, limit):
+    """The neighbours of every node in `nodes`, at most `limit` each, and the position of the node they came from"""
+    starts = indptr[nodes]
+    lengths = np.minimum(indptr[nodes + 1] - starts, limit)
+    # Offset of each output slot into `indices`: its node's start plus its place in that node's run
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+    return indices[offsets], np.repeat(np.arange(len(nodes)), lengths)
+
+
+class FollowGraph:
+    def __init__(self, followers, followed):
+        self.ids = np.unique(np.concatenate([followers, followed]))
+        sources = np.searchsorted(self.ids, followers)
+        targets = np.searchsorted(self.ids, followed)
+        self.out_ptr, self.out = csr(sources, targets, len(self.ids))
+        self.in_ptr, self.inc = csr(targets, sources, len(self.ids))
+        self.out_degree = np.diff(self.out_ptr)
+        self.in_degree = np.diff(self.in_ptr)
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        """Read every (follower, followed) pair in one pass into two id arrays"""
+        rows = Follow.objects.order_by().values_list("following_id", "followed_id").iterator(chunk_size=chunk_size)
+        edges = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+        return cls(edges[:, 0], edges[:, 1])
+
+    @property
+    def edges(self):
+        return len(self.out)
+
+    def score(self, node, top_k, limit, cofollow_weight):
+        """
+        Best accounts for `node` to follow: those followed by the accounts it follows (friends of
+        friends) and those following the same accounts (co-followers). Each path is weighted down
+        by the log of the degree it went through so prolific and celebrity accounts do not swamp
+        the scores. Returns (user ids, scores), best first.
+        """
+        follows = self.out[self.out_ptr[node]:self.out_ptr[node + 1]]
+        if not len(follows):
+            return self.ids[:0], np.zeros(0)
+        friends, via = gather(self.out_ptr, self.out, follows, limit)
+        cofollowers, co_via = gather(self.in_ptr, self.inc, follows, limit)
+        candidates = np.concatenate([friends, cofollowers])
+        weights = np.concatenate([1 / np.log2(2 + self.out_degree[follows])[via],
+                                  cofollow_weight / np.log2(2 + self.in_degree[follows])[co_via]])
+
+        keep = (candidates != node) & ~np.isin(candidates, follows)
+        candidates, inverse = np.unique(candidates[keep], return_inverse=True)
+        scores = np.bincount(inverse, weights=weights[keep])
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            candidates, scores = candidates[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        return self.ids[candidates[order]], scores[order]
+
+
+def store(results):
+    """Replace the suggestions of the users in `results`, a dict of user id -> (ids, scores)"""
+    rows = [Suggestion(user_id=user_id, suggested_id=int(suggested_id), score=float(score), rank=rank)
+            for user_id, (suggested_ids, scores) in results.items()
+            for rank, (suggested_id, score) in enumerate(zip(suggested_ids, scores))]
+    with transaction.atomic():
+        Suggestion.objects.filter(user_id__in=list(results)).delete()
+        Suggestion.objects.bulk_create(rows)
+
+
+def compute(graph, batch_size, top_k=None, limit=None, cofollow_weight=None):
+    """Score every user that follows someone and store the results in batches, returns the user count"""
+    top_k = top_k or settings.SUGGESTIONS_PER_USER
+    limit = limit or settings.SUGGESTION_NEIGHBOUR_LIMIT
+    cofollow_weight = settings.SUGGESTION_COFOLLOW_WEIGHT if cofollow_weight is None else cofollow_weight
+    nodes = np.flatnonzero(graph.out_degree)
+    for start in range(0, len(nodes), batch_size):
+        store({int(graph.ids[node]): graph.score(node, top_k, limit, cofollow_weight)
+               for node in nodes[start:start + batch_size]})
+    # Users who stopped following everyone keep no stale suggestions
+    Suggestion.objects.exclude(user__in=Follow.objects.values("following_id")).delete()
+    return len(nodes)
@@ -1,3 +1,1085 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router
+from django.db.migrations.executor import MigrationExecutor
+from django.conf import settings as django_settings
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.timesince import timesince
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from .cache import PRINCIPAL_FIELDS, get_profile, principal_key
+from .blacklist import BlacklistFilter, STAMP_KEY
+from .projections import Projector, compact_age, POST_COLUMNS, COMMENT_COLUMNS
+from .serializers import PostSerializer, CommentSerializer
+from .models import User, Post, Comment, Like, Follow, TimelineEntry, OutboxEmail, PendingUpload
+from .uploads import UploadBackend
+from . import metrics, outbox, reaper, timeline, trending, uploads
+
+
+class RefusingBackend(BaseEmailBackend):
+    """Email backend whose every send fails"""
+
+    def send_messages(self, messages):
+        raise OSError("Connection refused")
+
+
+class UnreachableBackend(BaseEmailBackend):
+    """Email backend that cannot connect at all"""
+
+    def open(self):
+        raise OSError("Name or service not known")
+
+
+@override_settings(OUTBOX_BACKOFF_SECONDS=30, OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+
+    def queue(self):
+        OutboxEmail.objects.create(subject="Hello", body="Woof", recipient=self.user.email)
+
+    def test_request_queues_and_worker_sends(self):
+        response = APIClient().post("/API/request-reset", {"email": self.user.email})
+        self.assertEqual(response.status_code, 200)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmail.PENDING)
+        self.assertEqual(mail.outbox, [])
+
+        call_command("send_outbox", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.SENT)
+        self.assertIsNotNone(email.sent_at)
+
+    def test_failed_send_backs_off(self):
+        self.queue()
+        with override_settings(EMAIL_BACKEND="API.tests.RefusingBackend"):
+            before = timezone.now()
+            self.assertEqual(outbox.deliver(), (0, 1))
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertIn("Connection refused", email.last_error)
+        self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=60))
+        # Not due again until the backoff has passed
+        self.assertEqual(outbox.deliver(), (0, 0))
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.deliver(), (1, 0))
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.SENT)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        self.queue()
+        with override_settings(EMAIL_BACKEND="API.tests.RefusingBackend"):
+            for _ in range(3):
+                OutboxEmail.objects.update(next_attempt_at=timezone.now())
+                outbox.deliver()
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.FAILED, 3))
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.deliver(), (0, 0))
+
+    def test_unreachable_server_fails_the_batch(self):
+        self.queue()
+        self.queue()
+        with override_settings(EMAIL_BACKEND="API.tests.UnreachableBackend"):
+            self.assertEqual(outbox.deliver(), (0, 2))
+        self.assertEqual(list(OutboxEmail.objects.values_list("attempts", flat=True)), [1, 1])
+
+
+class BrokenBackend(UploadBackend):
+    """Upload backend whose every upload fails"""
+
+    def upload(self, path, field):
+        raise OSError("Service unavailable")
+
+
+class UploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = override_settings(UPLOAD_BACKEND="API.uploads.LocalBackend", UPLOAD_STAGING_DIR=self.root / "staging",
+                                     UPLOAD_LOCAL_ROOT=self.root / "stored", UPLOAD_MAX_ATTEMPTS=2,
+                                     UPLOAD_BACKOFF_SECONDS=10)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_post(self):
+        image = SimpleUploadedFile("rex.jpg", b"\xff\xd8 not really a jpeg", content_type="image/jpeg")
+        response = self.client.post("/API/posts", {"message": "Walk", "image": image}, format="multipart")
+        self.assertEqual(response.status_code, 201, response.content)
+        return Post.objects.get()
+
+    def test_post_image_is_staged(self):
+        post = self.create_post()
+        self.assertEqual(post.status, Post.PROCESSING)
+        upload = PendingUpload.objects.get()
+        self.assertEqual((upload.post_id, upload.field, upload.status), (post.id, "image", PendingUpload.PENDING))
+        staged = Path(upload.path)
+        self.assertEqual(staged.parent, self.root / "staging")
+        self.assertEqual(staged.read_bytes(), b"\xff\xd8 not really a jpeg")
+
+    def test_worker_stores_the_file(self):
+        post = self.create_post()
+        staged = Path(PendingUpload.objects.get().path)
+        call_command("process_uploads", "--once", "--concurrency", "1", stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.status, Post.READY)
+        self.assertEqual(post.image.public_id, staged.stem)
+        self.assertEqual(PendingUpload.objects.get().status, PendingUpload.DONE)
+        self.assertEqual((self.root / "stored" / staged.name).read_bytes(), b"\xff\xd8 not really a jpeg")
+        self.assertFalse(staged.exists())
+
+    def test_failed_upload_is_retried_then_given_up(self):
+        post = self.create_post()
+        with override_settings(UPLOAD_BACKEND="API.tests.BrokenBackend"):
+            self.assertEqual(uploads.process_batch(concurrency=1), (0, 1))
+            upload = PendingUpload.objects.get()
+            self.assertEqual((upload.status, upload.attempts), (PendingUpload.PENDING, 1))
+            self.assertIn("Service unavailable", upload.last_error)
+            self.assertGreater(upload.next_attempt_at, timezone.now() + timedelta(seconds=15))
+            # Not due again until the backoff has passed
+            self.assertEqual(uploads.process_batch(concurrency=1), (0, 0))
+
+            PendingUpload.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(uploads.process_batch(concurrency=1), (0, 1))
+        self.assertEqual(PendingUpload.objects.get().status, PendingUpload.FAILED)
+        post.refresh_from_db()
+        self.assertEqual(post.status, Post.FAILED)
+        # A failed upload is not picked up again
+        PendingUpload.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(uploads.process_batch(concurrency=1), (0, 0))
+
+
+class BlacklistFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.filter = BlacklistFilter()
+
+    def blacklist(self, row_id):
+        jti = RefreshToken.for_user(self.user)["jti"]
+        BlacklistedToken.objects.create(id=row_id, token=OutstandingToken.objects.get(jti=jti))
+        cache.set(STAMP_KEY, time.time())
+        return jti
+
+    @override_settings(BLACKLIST_FILTER_OVERLAP_IDS=2)
+    def test_late_commit_of_a_lower_id_is_pulled(self):
+        first = self.blacklist(5)
+        self.assertTrue(self.filter.might_contain(first))
+        later = self.blacklist(7)
+        self.assertTrue(self.filter.might_contain(later))
+        # Id 6 was taken before 7 but only committed after it was pulled
+        late = self.blacklist(6)
+        self.assertTrue(self.filter.might_contain(late))
+        self.assertFalse(self.filter.might_contain("never blacklisted"))
+
+    @override_settings(BLACKLIST_FILTER_OVERLAP_IDS=1000)
+    def test_floor_trails_the_highest_id_read(self):
+        self.assertEqual(self.filter.floor(), 0)
+        self.filter.last_id = 1500
+        self.assertEqual(self.filter.floor(), 500)
+
+    @override_settings(BLACKLIST_FILTER_TTL=60)
+    def test_reads_only_after_a_new_blacklisting(self):
+        with self.assertNumQueries(2):
+            self.filter.might_contain("jti")
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.filter.might_contain("jti")
+        jti = self.blacklist(1)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.filter.might_contain(jti))
+        with self.assertNumQueries(0):
+            self.filter.might_contain(jti)
+        # A rebuild reads everything announced so far
+        self.filter.built_at -= django_settings.BLACKLIST_FILTER_REBUILD_SECONDS + 1
+        with self.assertNumQueries(2):
+            self.assertTrue(self.filter.might_contain(jti))
+        with self.assertNumQueries(0):
+            self.filter.might_contain(jti)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Routing against a second SQLite file that only catches up with the primary when told to"""
+    # Every alias, the replica included once it is set up
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = Path(tempfile.mkdtemp())
+        connections.settings["replica1"] = {**connections.settings[DEFAULT_DB_ALIAS],
+                                            "NAME": str(cls.root / "replica1.sqlite3")}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica1"].close()
+        del connections["replica1"]
+        del connections.settings["replica1"]
+        shutil.rmtree(cls.root)
+
+    def setUp(self):
+        cache.clear()
+        settings = override_settings(DATABASE_REPLICAS=["replica1"],
+                                     DATABASE_ROUTERS=["API.routers.ReplicaRouter"])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.fido = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        self.replicate()
+
+    def replicate(self):
+        """Copy the primary into the replica file"""
+        connections["replica1"].close()
+        connections[DEFAULT_DB_ALIAS].ensure_connection()
+        replica = sqlite3.connect(connections.settings["replica1"]["NAME"])
+        try:
+            connections[DEFAULT_DB_ALIAS].connection.backup(replica)
+        finally:
+            replica.close()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        return client
+
+    def following(self, client, user):
+        response = client.get(f"/API/user/{user.id}/following")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [follow["user"]["username"] for follow in response.data["results"]]
+
+    def test_request_reads_go_to_the_replica(self):
+        self.assertEqual(router.db_for_write(User), DEFAULT_DB_ALIAS)
+        # Not replicated yet
+        Follow.objects.create(following=self.rex, followed=self.fido)
+        self.assertEqual(self.following(self.client_for(self.fido), self.rex), [])
+        self.replicate()
+        self.assertEqual(self.following(self.client_for(self.fido), self.rex), ["fido"])
+
+    def test_writer_is_pinned_to_the_primary(self):
+        rex = self.client_for(self.rex)
+        response = rex.post("/API/follow", {"follow_id": self.fido.id})
+        self.assertEqual(response.status_code, 201, response.content)
+        # The follow only exists on the primary, which rex now reads from
+        self.assertEqual(self.following(rex, self.rex), ["fido"])
+        self.assertEqual(self.following(self.client_for(self.fido), self.rex), [])
+        with override_settings(REPLICA_PIN_SECONDS=0):
+            rex.post("/API/follow", {"follow_id": self.fido.id})
+            self.assertEqual(self.following(rex, self.rex), [])
+
+    def test_stream_reads_where_its_request_does(self):
+        rex = self.client_for(self.rex)
+        rex.post("/API/follow", {"follow_id": self.fido.id})
+
+        def streamed(client):
+            response = client.get(f"/API/user/{self.rex.id}/following?stream=true")
+            # Read after the middlewares have returned, as a server does
+            return [follow["user"]["username"] for follow in json.loads(b"".join(response.streaming_content))]
+
+        self.assertEqual(streamed(rex), ["fido"])
+        self.assertEqual(streamed(self.client_for(self.fido)), [])
+
+    def test_async_views_are_pinned(self):
+        rex = self.client_for(self.rex)
+        rex.post("/API/follow", {"follow_id": self.fido.id})
+        spot = User.objects.create_user(username="spot", email="spot@example.com", password="password")
+
+        def get_profile(user):
+            token = RefreshToken.for_user(user).access_token
+            get = async_to_sync(AsyncClient().get)
+            return get(f"/API/async/user/{spot.id}", headers={"Authorization": f"Bearer {token}"}).status_code
+
+        self.assertEqual(get_profile(self.fido), 404)
+        self.assertEqual(get_profile(self.rex), 200)
+
+    def test_workers_and_commands_read_the_primary(self):
+        self.assertEqual(router.db_for_read(User), DEFAULT_DB_ALIAS)
+        OutboxEmail.objects.create(subject="Hello", body="Woof", recipient=self.rex.email)
+        self.assertEqual(outbox.deliver(), (1, 0))
+        OutboxEmail.objects.create(subject="Hello", body="Woof", recipient=self.fido.email)
+        call_command("send_outbox", "--once", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class MetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.authorization = f"Bearer {RefreshToken.for_user(self.user).access_token}"
+
+    def assertCountsQueries(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="[1-9]\d* queries", serializer;')
+
+    def test_sync_view(self):
+        self.assertCountsQueries(self.client.get(f"/API/user/{self.user.id}", HTTP_AUTHORIZATION=self.authorization))
+
+    def test_async_view(self):
+        get = async_to_sync(AsyncClient().get)
+        self.assertCountsQueries(get(f"/API/async/user/{self.user.id}", headers={"Authorization": self.authorization}))
+
+    def test_streamed_queries_are_recorded(self):
+        fido = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        Follow.objects.create(following=self.user, followed=fido)
+        labels = (("view", "user_following"), ("method", "GET"))
+
+        def recorded():
+            return [histogram.series.get(labels, [None, 0])[1]
+                    for histogram in (metrics.DB_QUERIES, metrics.RESPONSE_SIZE)]
+
+        queries, size = recorded()
+        response = self.client.get(f"/API/user/{self.user.id}/following?stream=true",
+                                   HTTP_AUTHORIZATION=self.authorization)
+        self.assertEqual(recorded(), [queries, size])
+        content = b"".join(response.streaming_content)
+        self.assertEqual([follow["user"]["username"] for follow in json.loads(content)], ["fido"])
+        # The follows and their users, both read while streaming
+        self.assertEqual(recorded(), [queries + 2, size + len(content)])
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        rest_framework = {**django_settings.REST_FRAMEWORK,
+                          "DEFAULT_THROTTLE_RATES": {"follow.user": "2/min", "follow.ip": "100/min"}}
+        settings = override_settings(REST_FRAMEWORK=rest_framework)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertThrottledOnThirdFollow(self):
+        for _ in range(2):
+            # Refused by the view, still a request against the limit
+            self.assertEqual(self.client.post("/API/follow", {"follow_id": self.user.id}).status_code, 400)
+        response = self.client.post("/API/follow", {"follow_id": self.user.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+    def test_local_bucket(self):
+        self.assertThrottledOnThirdFollow()
+
+    def test_shared_cache_counts_with_add_and_incr(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                                                   "LOCATION": root}}):
+            self.assertThrottledOnThirdFollow()
+
+    @skipUnless(os.getenv("REDIS_URL"), "needs a Redis server in REDIS_URL")
+    def test_redis_script(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache",
+                                                   "LOCATION": os.getenv("REDIS_URL")}}):
+            cache.clear()
+            self.assertThrottledOnThirdFollow()
+
+
+class TombstonedUserTests(TestCase):
+    """A tombstoned user keeps their email and username until the reaper deletes them"""
+
+    def setUp(self):
+        cache.clear()
+        reaper.tombstone(User.objects.create_user(username="rex", email="rex@example.com", password="password"))
+        self.user = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sign_up(self):
+        for username, email, field in (("rex", "new@example.com", "username"), ("new", "rex@example.com", "email")):
+            response = APIClient().post("/API/user", {"username": username, "email": email, "password": "password"})
+            self.assertEqual(response.status_code, 400, response.content)
+            self.assertIn(field, response.data)
+
+    def test_update(self):
+        for username, email, field in (("rex", "fido@example.com", "username"), ("fido", "rex@example.com", "email")):
+            response = self.client.put(f"/API/user/{self.user.id}/update", {"username": username, "email": email,
+                                                                             "bio": "", "gender": "m", "avatar": "x"})
+            self.assertEqual(response.status_code, 400, response.content)
+            self.assertEqual(list(response.data), [field])
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.username, self.user.email), ("fido", "fido@example.com"))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        posts = [Post.objects.create(message=f"walk {i}", image="img", owner=self.user) for i in range(7)]
+        # Ties on created_at are broken by id
+        Post.objects.filter(id__in=[post.id for post in posts[2:5]]).update(created_at=posts[2].created_at)
+        self.expected = list(Post.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            ids += [post["id"] for post in response.data["results"]]
+            url = response.data["next"]
+        return ids
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(self.pages(f"/API/user/{self.user.id}/posts?page_size=2"), self.expected)
+
+    def test_tampered_cursor(self):
+        def cursor(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+        for tampered in ("not base64!", cursor({"a": 1}), cursor(["2024-01-01T00:00:00"]), cursor([None, 1]),
+                         cursor(["yesterday", 1]), cursor([[], 1])):
+            response = self.client.get(f"/API/user/{self.user.id}/posts", {"cursor": tampered})
+            self.assertEqual(response.status_code, 404, tampered)
+
+
+class ListQueryCountTests(TestCase):
+    """Post lists cost the same number of queries whatever their page size"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.owners = [User.objects.create_user(username=f"pup{i}", email=f"pup{i}@example.com", password="password")
+                       for i in range(3)]
+        for owner in self.owners:
+            Follow.objects.create(following=self.user, followed=owner)
+        for i in range(12):
+            post = Post.objects.create(message=f"walk {i}", image="img", owner=self.owners[i % 3])
+            for owner in self.owners:
+                Comment.objects.create(post=post, owner=owner, message="Woof")
+                Like.objects.create(post=post, owner=owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertPagesCost(self, url, queries, sizes=(2, 12)):
+        for size in sizes:
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, {"page_size": size})
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(len(response.data["results"]), size)
+
+    def test_feed(self):
+        self.assertPagesCost("/API/feed", 7)
+
+    def test_explore(self):
+        self.assertPagesCost("/API/explore", 4)
+
+    def test_user_posts(self):
+        self.assertPagesCost(f"/API/user/{self.owners[0].id}/posts", 4, sizes=(2, 4))
+
+
+class CounterBackfillTests(TransactionTestCase):
+    before = [("API", "0006_post_ordering_feed_indexes")]
+    after = [("API", "0007_counters")]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_existing_rows_are_counted(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        User, Post = apps.get_model("API", "User"), apps.get_model("API", "Post")
+        Like, Comment, Follow = (apps.get_model("API", name) for name in ("Like", "Comment", "Follow"))
+        rex = User.objects.create(username="rex", email="rex@example.com", avatar="img")
+        fido = User.objects.create(username="fido", email="fido@example.com", avatar="img")
+        post = Post.objects.create(message="Walk", image="img", owner=rex)
+        Like.objects.create(post=post, owner=rex)
+        Like.objects.create(post=post, owner=fido)
+        Comment.objects.create(post=post, owner=fido, message="Woof")
+        Follow.objects.create(following=fido, followed=rex)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        post = apps.get_model("API", "Post").objects.get()
+        self.assertEqual((post.like_count, post.comment_count), (2, 1))
+        users = apps.get_model("API", "User").objects.order_by("username")
+        self.assertEqual([(user.username, user.follower_count, user.following_count) for user in users],
+                         [("fido", 0, 1), ("rex", 1, 0)])
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.fido = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        self.spot = User.objects.create_user(username="spot", email="spot@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.rex)
+        for followed in (self.fido, self.spot):
+            self.assertEqual(self.client.post("/API/follow", {"follow_id": followed.id}).status_code, 201)
+
+    def post(self, owner, message):
+        client = APIClient()
+        client.force_authenticate(owner)
+        response = client.post("/API/posts", {"message": message, "image": "img"})
+        self.assertEqual(response.status_code, 201, response.content)
+        return Post.objects.get(id=response.data["id"])
+
+    def feed(self, page_size=20):
+        messages, url = [], f"/API/feed?page_size={page_size}"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            messages += [post["message"] for post in response.data["results"]]
+            url = response.data["next"]
+        return messages
+
+    def test_posts_are_pushed_to_followers(self):
+        post = self.post(self.fido, "Walk")
+        self.assertTrue(post.fanned_out)
+        self.assertEqual(list(TimelineEntry.objects.values_list("user", "post", "created_at")),
+                         [(self.rex.id, post.id, post.created_at)])
+        self.assertEqual(self.feed(), ["Walk"])
+
+    @override_settings(FANOUT_MAX_FOLLOWERS=0)
+    def test_celebrity_posts_are_pulled(self):
+        post = self.post(self.fido, "Red carpet")
+        self.assertFalse(post.fanned_out)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), ["Red carpet"])
+        # Still pulled once the author is back under the threshold
+        with override_settings(FANOUT_MAX_FOLLOWERS=1000):
+            self.assertEqual(self.feed(), ["Red carpet"])
+
+    def test_pushed_and_pulled_posts_merge_in_order(self):
+        expected = []
+        for i in range(9):
+            with override_settings(FANOUT_MAX_FOLLOWERS=0 if i % 3 == 0 else 1000):
+                expected.insert(0, self.post(self.fido if i % 2 else self.spot, f"walk {i}").message)
+        self.assertEqual(self.feed(page_size=2), expected)
+
+    def test_unfollow_prunes_and_follow_backfills(self):
+        self.post(self.fido, "Walk")
+        self.post(self.spot, "Nap")
+        self.client.delete(f"/API/unfollow/{self.fido.id}")
+        self.assertEqual(self.feed(), ["Nap"])
+        self.client.post("/API/follow", {"follow_id": self.fido.id})
+        self.assertEqual(self.feed(), ["Nap", "Walk"])
+
+    @override_settings(TIMELINE_MAX_ENTRIES=3)
+    def test_trim_keeps_the_newest_entries(self):
+        posts = [self.post(self.fido, f"walk {i}") for i in range(5)]
+        call_command("trim_timelines", stdout=StringIO())
+        self.assertEqual(set(TimelineEntry.objects.values_list("post", flat=True)), {post.id for post in posts[2:]})
+
+    def test_rebuild_fills_timelines_of_existing_follows(self):
+        post = Post.objects.create(message="Before timelines", image="img", owner=self.fido)
+        self.assertEqual(self.feed(), ["Before timelines"])
+        call_command("rebuild_timelines", stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.fanned_out)
+        self.assertEqual(list(TimelineEntry.objects.values_list("post", flat=True)), [post.id])
+        self.assertEqual(self.feed(), ["Before timelines"])
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.fido = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.fido)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/API/follow", {"follow_id": self.rex.id})
+            self.post = Post.objects.create(message="Walk", image="img", owner=self.rex)
+            Comment.objects.create(message="Good dog", post=self.post, owner=self.fido)
+
+    def rename(self, user, username):
+        with self.captureOnCommitCallbacks(execute=True):
+            user.username = username
+            user.save()
+
+    def shown_names(self):
+        profile = self.client.get(f"/API/user/{self.rex.id}?expand=true").data
+        return ([follow["following"]["username"] for follow in profile["followers"]],
+                [comment["owner"]["username"] for comment in profile["posts"][0]["comments"]])
+
+    def test_expanded_profile_shows_edited_users(self):
+        self.assertEqual(self.shown_names(), (["fido"], ["fido"]))
+        self.assertIsNotNone(get_profile(self.rex.id, "full"))
+        self.rename(self.fido, "sir fido")
+        self.assertEqual(self.shown_names(), (["sir fido"], ["sir fido"]))
+
+    def test_summary_is_refreshed(self):
+        self.assertEqual(self.client.get(f"/API/user/{self.fido.id}").data["username"], "fido")
+        self.rename(self.fido, "sir fido")
+        self.assertEqual(self.client.get(f"/API/user/{self.fido.id}").data["username"], "sir fido")
+
+    def test_login_leaves_profiles_cached(self):
+        self.shown_names()
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            self.fido.last_login = timezone.now()
+            self.fido.save(update_fields=["last_login"])
+        self.assertIsNotNone(get_profile(self.rex.id, "full"))
+
+    def test_post_etag_changes_with_its_commenters(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                                                   "LOCATION": root}}):
+            etag = self.client.get(f"/API/post/{self.post.id}")["ETag"]
+            self.assertEqual(self.client.get(f"/API/post/{self.post.id}", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.rename(self.fido, "sir fido")
+            response = self.client.get(f"/API/post/{self.post.id}", HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["comments"][0]["owner"]["username"], "sir fido")
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        for username in ("t-rex", "rexy"):
+            User.objects.create_user(username=username, email=f"{username}@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.rex)
+
+    def search(self, query, bio=False):
+        response = self.client.get("/API/users", {"username": query, "bio": str(bio).lower()})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [user["username"] for user in response.data["results"]]
+
+    def test_exact_then_prefix_then_substring(self):
+        self.assertEqual(self.search("REX"), ["rex", "rexy", "t-rex"])
+
+    def test_short_queries_match_anywhere(self):
+        self.assertEqual(self.search("ex"), ["rex", "t-rex", "rexy"])
+        self.assertEqual(self.search("-r"), ["t-rex"])
+
+    def test_index_follows_create_rename_and_delete(self):
+        spot = User.objects.create_user(username="spot", email="spot@example.com", password="password",
+                                        bio="Fetches sticks")
+        self.assertEqual(self.search("spot"), ["spot"])
+        self.assertEqual(self.search("stick", bio=True), ["spot"])
+        spot.username = "sparky"
+        spot.save()
+        self.assertEqual(self.search("spot"), [])
+        self.assertEqual(self.search("park"), ["sparky"])
+        spot.delete()
+        self.assertEqual(self.search("park"), [])
+        self.assertEqual(self.search("stick", bio=True), [])
+
+
+class LikeTests(TestCase):
+    def setUp(self):
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.post = Post.objects.create(message="Walk", image="img", owner=self.rex)
+        self.client = APIClient()
+        self.client.force_authenticate(self.rex)
+
+    def like_count(self):
+        self.post.refresh_from_db()
+        return self.post.like_count
+
+    def test_double_like_counts_once(self):
+        self.assertEqual(self.client.post(f"/API/post/{self.post.id}/like").status_code, 201)
+        self.assertEqual(self.client.post(f"/API/post/{self.post.id}/like").status_code, 400)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+        self.assertEqual(self.like_count(), 1)
+
+    def test_unlike_then_like_again(self):
+        self.client.post(f"/API/post/{self.post.id}/like")
+        self.assertEqual(self.client.delete(f"/API/post/{self.post.id}/unlike").status_code, 204)
+        self.assertEqual(self.like_count(), 0)
+        self.assertEqual(self.client.post(f"/API/post/{self.post.id}/like").status_code, 201)
+        self.assertEqual(self.like_count(), 1)
+
+    def test_missing_post(self):
+        self.assertEqual(self.client.post(f"/API/post/{self.post.id + 1}/like").status_code, 404)
+        self.assertFalse(Like.objects.exists())
+
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        rex = User.objects.create_user(username="rex", email="rex@example.com", password="password", bio="Good boy")
+        fido = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        for i, owner in enumerate((rex, fido)):
+            post = Post.objects.create(message=f"walk {i}", image="img", owner=owner)
+            Like.objects.create(post=post, owner=rex)
+            for j in range(4):
+                Comment.objects.create(message=f"woof {j}", post=post, owner=(rex, fido)[j % 2])
+
+    def assertSameJSON(self, projected, serialized):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(projected), renderer.render(serialized))
+
+    def test_posts_render_as_serialized(self):
+        for compact in (False, True):
+            with self.subTest(compact=compact):
+                request = Request(APIRequestFactory().get("/API/feed", {"compact": str(compact).lower()}))
+                context = {"now": self.now, "request": request}
+                self.assertSameJSON(Projector(now=self.now, compact=compact).posts(Post.objects.values(*POST_COLUMNS)),
+                                    PostSerializer(Post.objects.with_details(), many=True, context=context).data)
+
+    def test_comments_render_as_serialized(self):
+        comments = Comment.objects.order_by("-created_at", "-id")
+        self.assertSameJSON(Projector(now=self.now).comments(comments.values(*COMMENT_COLUMNS)),
+                            CommentSerializer(comments.select_related("owner"), many=True,
+                                              context={"now": self.now}).data)
+
+    def test_compact_age_is_the_largest_unit_of_timesince(self):
+        units = {"year": "y", "month": "m", "week": "w", "day": "d", "hour": "h", "minute": "m"}
+        for delta in (timedelta(seconds=30), timedelta(minutes=5), timedelta(hours=3, minutes=59), timedelta(days=1),
+                      timedelta(days=13), timedelta(days=45), timedelta(days=400)):
+            with self.subTest(delta=delta):
+                count, unit = timesince(self.now - delta, self.now).split(",")[0].split("\xa0")
+                self.assertEqual(compact_age(self.now - delta, self.now), count + units[unit.rstrip("s")])
+        self.assertEqual(compact_age(self.now + timedelta(minutes=1), self.now), "0m")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                                                         "LOCATION": root}})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.fido = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.rex)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/API/follow", {"follow_id": self.fido.id})
+            self.post = Post.objects.create(message="Walk", image="img", owner=self.fido)
+
+    def assertChangesWith(self, url, write):
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_post(self):
+        self.assertChangesWith(f"/API/post/{self.post.id}", lambda: self.client.post(f"/API/post/{self.post.id}/like"))
+
+    def test_profile(self):
+        self.assertChangesWith(f"/API/user/{self.fido.id}",
+                               lambda: User.objects.get(id=self.fido.id).save(update_fields=["bio"]))
+        self.assertChangesWith(f"/API/user/{self.fido.id}?expand=true",
+                               lambda: Comment.objects.create(message="Woof", post=self.post, owner=self.rex))
+
+    def test_feed(self):
+        self.assertChangesWith("/API/feed",
+                               lambda: Comment.objects.create(message="Woof", post=self.post, owner=self.fido))
+        self.assertChangesWith("/API/feed", lambda: Post.objects.create(message="Nap", image="img", owner=self.fido))
+
+    def test_missing_resource(self):
+        self.assertEqual(self.client.get(f"/API/post/{self.post.id + 1}").status_code, 404)
+
+    def test_no_etag_without_a_shared_cache(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assertNotIn("ETag", self.client.get(f"/API/post/{self.post.id}"))
+
+
+class PrincipalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.fido = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.rex).access_token}")
+
+    def follow(self):
+        return self.client.post("/API/follow", {"follow_id": self.fido.id}).status_code
+
+    def test_only_the_principal_fields_are_cached(self):
+        self.assertEqual(self.follow(), 201)
+        self.assertEqual(cache.get(principal_key(self.rex.id)),
+                         {"id": self.rex.id, "username": "rex", "is_active": True, "deleted_at": None})
+        self.assertEqual(set(PRINCIPAL_FIELDS), {"id", "username", "is_active", "deleted_at"})
+
+    def test_tombstoned_user_cannot_write(self):
+        self.assertEqual(self.follow(), 201)
+        self.client.delete(f"/API/unfollow/{self.fido.id}")
+        with self.captureOnCommitCallbacks(execute=True):
+            reaper.tombstone(self.rex)
+        self.assertEqual(self.follow(), 401)
+        self.assertEqual(self.client.post("/API/posts", {"message": "Walk", "image": "img"}).status_code, 401)
+
+    def test_deactivated_user_cannot_write(self):
+        self.assertEqual(self.follow(), 201)
+        self.client.delete(f"/API/unfollow/{self.fido.id}")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rex.is_active = False
+            self.rex.save(update_fields=["is_active"])
+        self.assertEqual(self.follow(), 401)
+
+    def test_stale_principal_is_still_checked(self):
+        cache.set(principal_key(self.rex.id), {"id": self.rex.id, "username": "rex", "is_active": True,
+                                               "deleted_at": timezone.now()})
+        self.assertEqual(self.follow(), 401)
+
+    def test_password_change_drops_the_principal(self):
+        self.follow()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rex.set_password("new password")
+            self.rex.save(update_fields=["password"])
+        self.assertIsNone(cache.get(principal_key(self.rex.id)))
+
+
+@override_settings(COMMENT_PREVIEW_SIZE=3)
+class CommentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.rex)
+        self.posts = [Post.objects.create(message=f"walk {i}", image="img", owner=self.rex) for i in range(2)]
+        for post, comments in zip(self.posts, (7, 1)):
+            for i in range(comments):
+                self.client.post(f"/API/post/{post.id}/comments", {"message": f"woof {i}"})
+
+    def messages(self, comments):
+        return [comment["message"] for comment in comments]
+
+    def test_comments_are_paged_newest_first(self):
+        messages, url = [], f"/API/post/{self.posts[0].id}/comments?page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertLessEqual(len(response.data["results"]), 3)
+            messages += self.messages(response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(messages, [f"woof {i}" for i in reversed(range(7))])
+
+    def test_posts_embed_the_newest_comments_and_their_count(self):
+        response = self.client.get(f"/API/post/{self.posts[0].id}")
+        self.assertEqual(self.messages(response.data["comments"]), ["woof 6", "woof 5", "woof 4"])
+        self.assertEqual(response.data["comment_count"], 7)
+        previews = {post["id"]: post for post in self.client.get("/API/posts").data}
+        self.assertEqual(self.messages(previews[self.posts[0].id]["comments"]), ["woof 6", "woof 5", "woof 4"])
+        self.assertEqual(self.messages(previews[self.posts[1].id]["comments"]), ["woof 0"])
+
+    def test_previews_cost_one_query_for_the_page(self):
+        with self.assertNumQueries(4):
+            self.client.get("/API/posts")
+        for i in range(20):
+            Comment.objects.create(message="more", post=self.posts[1], owner=self.rex)
+        with self.assertNumQueries(4):
+            response = self.client.get("/API/posts")
+        self.assertEqual([len(post["comments"]) for post in response.data], [3, 3])
+
+
+class ProfileTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.pups = [User.objects.create_user(username=f"pup{i}", email=f"pup{i}@example.com", password="password")
+                     for i in range(5)]
+        for pup in self.pups:
+            client = APIClient()
+            client.force_authenticate(pup)
+            client.post("/API/follow", {"follow_id": self.rex.id})
+        Post.objects.create(message="Walk", image="img", owner=self.rex)
+        self.client = APIClient()
+        self.client.force_authenticate(self.rex)
+        self.client.post("/API/follow", {"follow_id": self.pups[0].id})
+
+    def names(self, url, page_size):
+        names = []
+        while url:
+            response = self.client.get(url, {"page_size": page_size} if "cursor" not in url else None)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertLessEqual(len(response.data["results"]), page_size)
+            names += [follow["user"]["username"] for follow in response.data["results"]]
+            url = response.data["next"]
+        return names
+
+    def test_summary_has_no_lists(self):
+        response = self.client.get(f"/API/user/{self.rex.id}")
+        self.assertEqual(response.data, {"id": self.rex.id, "username": "rex", "email": "rex@example.com", "bio": None,
+                                         "avatar": "", "gender": None,
+                                         "follower_count": 5, "following_count": 1})
+
+    def test_expanded_profile_is_opt_in(self):
+        profile = self.client.get(f"/API/user/{self.rex.id}?expand=true").data
+        self.assertEqual([post["message"] for post in profile["posts"]], ["Walk"])
+        self.assertEqual(len(profile["followers"]), 5)
+        self.assertEqual(len(profile["followings"]), 1)
+
+    def test_follows_are_paged_newest_first(self):
+        self.assertEqual(self.names(f"/API/user/{self.rex.id}/followers", 2),
+                         [f"pup{i}" for i in reversed(range(5))])
+        self.assertEqual(self.names(f"/API/user/{self.rex.id}/following", 2), ["pup0"])
+
+    def test_follow_pages_cost_the_same_whatever_their_size(self):
+        for size in (1, 5):
+            with self.assertNumQueries(2):
+                self.client.get(f"/API/user/{self.rex.id}/followers", {"page_size": size})
+
+
+class SuggestionTests(TestCase):
+    def setUp(self):
+        self.users = {name: User.objects.create_user(username=name, email=f"{name}@example.com", password="password")
+                      for name in ("rex", "fido", "spot", "max", "bo", "lily")}
+        for follower, followed in (("rex", "fido"), ("rex", "spot"), ("fido", "max"), ("spot", "max"),
+                                   ("spot", "bo"), ("lily", "fido")):
+            Follow.objects.create(following=self.users[follower], followed=self.users[followed])
+        call_command("compute_suggestions", stdout=StringIO())
+        self.client = APIClient()
+        self.client.force_authenticate(self.users["rex"])
+
+    def suggested(self):
+        response = self.client.get("/API/users/suggestions")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [suggestion["user"]["username"] for suggestion in response.data]
+
+    def test_friends_of_friends_first_then_cofollowers(self):
+        self.assertEqual(self.suggested(), ["max", "bo", "lily"])
+        response = self.client.get("/API/users/suggestions")
+        scores = [suggestion["score"] for suggestion in response.data]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_served_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.suggested()
+
+    def test_followed_and_tombstoned_users_are_left_out(self):
+        Follow.objects.create(following=self.users["rex"], followed=self.users["max"])
+        reaper.tombstone(self.users["lily"])
+        self.assertEqual(self.suggested(), ["bo"])
+
+
+@override_settings(TRENDING_HALF_LIFE_HOURS=12, TRENDING_POST_WEIGHT=1, TRENDING_LIKE_WEIGHT=1)
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        self.fans = [User.objects.create_user(username=f"fan{i}", email=f"fan{i}@example.com", password="password")
+                     for i in range(7)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.rex)
+
+    def post(self, message, hours_ago=0, likes=0):
+        created_at = timezone.now() - timedelta(hours=hours_ago)
+        post = Post.objects.create(message=message, image="img", owner=self.rex)
+        Post.objects.filter(id=post.id).update(created_at=created_at)
+        for fan in self.fans[:likes]:
+            Like.objects.create(post=post, owner=fan)
+        Like.objects.filter(post=post).update(created_at=created_at)
+        return post
+
+    def explore(self):
+        return [post["message"] for post in self.client.get("/API/explore").data["results"]]
+
+    def test_new_posts_are_ranked_as_they_are_created(self):
+        for message in ("Walk", "Nap"):
+            self.assertEqual(self.client.post("/API/posts", {"message": message, "image": "img"}).status_code, 201)
+        self.assertEqual(self.explore(), ["Nap", "Walk"])
+        self.assertFalse(Post.objects.filter(trending_score=0).exists())
+
+    def test_engagement_decays(self):
+        self.post("Liked yesterday", hours_ago=24, likes=7)
+        self.post("Liked last week", hours_ago=24 * 7, likes=7)
+        self.post("Just now")
+        trending.refresh(100, full=True)
+        # Eight events a day ago weigh twice one event now, one event now outweighs eight a week ago
+        self.assertEqual(self.explore(), ["Liked yesterday", "Just now", "Liked last week"])
+
+    def test_removed_likes_lower_the_score(self):
+        liked = self.post("Liked", hours_ago=1, likes=3)
+        self.post("Quiet")
+        trending.refresh(100, full=True)
+        self.assertEqual(self.explore(), ["Liked", "Quiet"])
+        Like.objects.filter(post=liked).delete()
+        trending.refresh(100)
+        liked.refresh_from_db()
+        self.assertAlmostEqual(liked.trending_score, trending.new_post_score(liked.created_at))
+        self.assertEqual(self.explore(), ["Quiet", "Liked"])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        fido = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        post = Post.objects.create(message="Walk", image="img", owner=self.rex)
+        Comment.objects.create(message="Good walk", post=post, owner=self.rex)
+        Like.objects.create(post=post, owner=self.rex)
+        Follow.objects.create(following=self.rex, followed=fido)
+        Follow.objects.create(following=fido, followed=self.rex)
+        self.client = APIClient()
+        self.client.force_authenticate(self.rex)
+
+    def export(self, accept="application/x-ndjson", **params):
+        response = self.client.get("/API/user/export", params, HTTP_ACCEPT=accept)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_every_section_is_streamed_in_order(self):
+        records = self.export()
+        self.assertEqual([record["type"] for record in records],
+                         ["profile", "post", "comment", "like", "following", "follower"])
+        self.assertEqual(records[0]["data"]["username"], "rex")
+        self.assertEqual(records[1]["data"]["message"], "Walk")
+
+    def test_any_accept_header_gets_ndjson(self):
+        expected = self.export()
+        for accept in ("*/*", "application/json", "text/html"):
+            with self.subTest(accept=accept):
+                self.assertEqual(self.export(accept), expected)
+
+    def test_cursor_resumes_after_the_last_line(self):
+        records = self.export()
+        self.assertEqual(self.export(cursor=records[2]["cursor"]), records[3:])
+        self.assertEqual(self.client.get("/API/user/export", {"cursor": "nope:1"}).status_code, 404)
+
+
+class ReaperTests(TestCase):
+    def test_tombstoned_user_is_deleted_with_their_rows(self):
+        rex = User.objects.create_user(username="rex", email="rex@example.com", password="password")
+        fido = User.objects.create_user(username="fido", email="fido@example.com", password="password")
+        walk = Post.objects.create(message="Walk", image="img", owner=fido)
+        for i in range(3):
+            post = Post.objects.create(message=f"nap {i}", image="img", owner=rex)
+            Like.objects.create(post=post, owner=fido)
+        Like.objects.create(post=walk, owner=rex)
+        Comment.objects.create(message="Woof", post=walk, owner=rex)
+        Follow.objects.create(following=rex, followed=fido)
+        Post.objects.filter(id=walk.id).update(like_count=1, comment_count=1)
+        User.objects.filter(id=fido.id).update(follower_count=1)
+        reaper.tombstone(rex)
+        self.assertEqual(reaper.Reaper(chunk_size=2).run()[:2], (0, 1))
+        self.assertFalse(User.all_objects.filter(id=rex.id).exists())
+        self.assertEqual(Post.all_objects.count(), 1)
+        self.assertEqual((Like.all_objects.count(), Comment.all_objects.count(), Follow.all_objects.count()), (0, 0, 0))
+        walk.refresh_from_db()
+        fido.refresh_from_db()
+        self.assertEqual((walk.like_count, walk.comment_count, fido.follower_count), (0, 0, 0))
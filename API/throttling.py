@@ -0,0 +1,149 @@
+"""
+Token bucket throttles on the shared cache.
+
+A bucket is kept as one number, the time at which it would be full again (the generic
+cell rate algorithm), so taking a token is a single atomic read-modify-write: a Lua
+script on Redis, or a locked get and set on a LocMemCache, which lives in the process
+anyway. Other shared caches, such as Memcached, have no such operation and count
+requests per period with add and incr instead.
+"""
+import math
+import re
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# KEYS[1] is the bucket, ARGV[1] the microseconds per token and ARGV[2] the capacity in
+# microseconds. Returns 0 when a token was taken, else the microseconds until one refills.
+TAKE_SCRIPT = """
+local now = redis.call("TIME")
+now = tonumber(now[1]) * 1000000 + tonumber(now[2])
+local interval, capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+local full_at = math.max(tonumber(redis.call("GET", KEYS[1]) or 0), now) + interval
+if full_at - now > capacity then
+    return math.ceil(full_at - now - capacity)
+end
+redis.call("SET", KEYS[1], string.format("%.0f", full_at), "PX", math.ceil((full_at - now) / 1000))
+return 0
+"""
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """(microseconds per token, capacity in microseconds) of a DRF rate such as "30/min" """
+    count, period = rate.split("/")
+    interval = max(1, round(PERIODS[period[0]] * 1000000 / int(count)))
+    return interval, interval * int(count)
+
+
+class Buckets:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Take script by Redis server URL
+        self.scripts = {}
+
+    def take(self, key, rate):
+        """Take a token from bucket `key`, returns 0 or the seconds until one is available"""
+        interval, capacity = parse_rate(rate)
+        cache = caches[DEFAULT_CACHE_ALIAS]
+        if isinstance(cache, RedisCache):
+            return self.take_shared(cache, key, interval, capacity) / 1000000
+        if isinstance(cache, LocMemCache):
+            return self.take_local(cache, key, interval, capacity) / 1000000
+        return self.take_counted(cache, key, interval, capacity) / 1000000
+
+    def script(self):
+        """The take script on the server the Redis cache writes to, the first of its LOCATION"""
+        location = settings.CACHES[DEFAULT_CACHE_ALIAS]["LOCATION"]
+        url = (re.split("[;,]", location) if isinstance(location, str) else location)[0]
+        with self.lock:
+            if url not in self.scripts:
+                # Installed wherever a Redis cache is configured
+                import redis
+                self.scripts[url] = redis.Redis.from_url(url).register_script(TAKE_SCRIPT)
+            return self.scripts[url]
+
+    def take_shared(self, cache, key, interval, capacity):
+        return self.script()(keys=[cache.make_and_validate_key(key)], args=[interval, capacity])
+
+    def take_counted(self, cache, key, interval, capacity):
+        """
+        Count the request in the current period of the rate with add and incr, refusing
+        it past the bucket's size. Bursts around the start of a period can reach twice the
+        rate, as a counter cannot tell how the requests of the previous period were spread.
+        """
+        now = time.time() * 1000000
+        period = int(now // capacity)
+        key = f"{key}:{period}"
+        remaining = (period + 1) * capacity - now
+        cache.add(key, 0, timeout=math.ceil(remaining / 1000000))
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Expired in between, the period is over
+            return 0
+        if count * interval > capacity:
+            return remaining
+        return 0
+
+    def take_local(self, cache, key, interval, capacity):
+        now = time.time() * 1000000
+        with self.lock:
+            full_at = max(cache.get(key, 0), now) + interval
+            if full_at - now > capacity:
+                return full_at - now - capacity
+            cache.set(key, full_at, timeout=math.ceil((full_at - now) / 1000000))
+        return 0
+
+
+buckets = Buckets()
+
+
+class BucketThrottle(BaseThrottle):
+    """
+    Takes a token for the client from the bucket of the view's throttle_scope, limited by
+    the "<throttle_scope>.<kind>" entry of DEFAULT_THROTTLE_RATES. Views without a scope
+    or a rate are not throttled and cost no cache operation.
+    """
+    kind = None
+    delay = None
+
+    def get_client_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f"{scope}.{self.kind}") if scope else None
+        client = self.get_client_key(request) if rate else None
+        if client is None:
+            return True
+        self.delay = buckets.take(f"throttle:{scope}.{self.kind}:{client}", rate)
+        return not self.delay
+
+    def wait(self):
+        return self.delay
+
+
+class UserBucketThrottle(BucketThrottle):
+    """One bucket per authenticated user, anonymous requests are left to AddressBucketThrottle"""
+    kind = "user"
+
+    def get_client_key(self, request):
+        return request.user.id if request.user.is_authenticated else None
+
+
+class AddressBucketThrottle(BucketThrottle):
+    """One bucket per client address, see NUM_PROXIES"""
+    kind = "ip"
+
+    def get_client_key(self, request):
+        return self.get_ident(request)
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from .models import User, Post, Follow, TimelineEntry
+
+
+def is_celebrity(user_id):
+    """Authors whose new posts are pulled into their followers' feeds instead of pushed"""
+    followers = User.objects.filter(id=user_id).values_list("follower_count", flat=True).first()
+    return (followers or 0) > settings.FANOUT_MAX_FOLLOWERS
+
+
+def _insert(entries):
+    TimelineEntry.objects.bulk_create(entries, batch_size=settings.FANOUT_BATCH_SIZE, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """
+    Push a new post into the timeline of every follower of its owner. Posts of
+    celebrities stay unflagged and are pulled at read time for as long as they exist,
+    whatever their author's follower count becomes.
+    """
+    if is_celebrity(post.owner_id):
+        return
+    followers = (Follow.objects.filter(followed=post.owner_id)
+                 .values_list("following_id", flat=True)
+                 .iterator(chunk_size=settings.FANOUT_BATCH_SIZE))
+    batch = []
+    for follower_id in followers:
+        batch.append(TimelineEntry(user_id=follower_id, post=post, created_at=post.created_at))
+        if len(batch) == settings.FANOUT_BATCH_SIZE:
+            _insert(batch)
+            batch = []
+    _insert(batch)
+    # Flagged last, a post also pulled in the meantime is shown once
+    Post.all_objects.filter(id=post.id).update(fanned_out=True)
+    post.fanned_out = True
+
+
+def backfill(follower_id, followed_id):
+    """Copy the latest pushed posts of a newly followed user into the follower's timeline"""
+    recent = (Post.objects.filter(owner=followed_id, fanned_out=True)
+              .values_list("id", "created_at")[:settings.TIMELINE_BACKFILL])
+    _insert([TimelineEntry(user_id=follower_id, post_id=post_id, created_at=created_at)
+             for post_id, created_at in recent])
+    trim(follower_id)
+
+
+def prune(follower_id, followed_id):
+    """Drop an unfollowed user's posts from the follower's timeline"""
+    TimelineEntry.objects.filter(user=follower_id, post__owner=followed_id).delete()
+
+
+def trim(user_id):
+    """Drop the user's timeline entries past the newest TIMELINE_MAX_ENTRIES, returns how many"""
+    cap = settings.TIMELINE_MAX_ENTRIES
+    oldest = list(TimelineEntry.objects.filter(user=user_id).order_by("-created_at", "-post_id")
+                  .values_list("created_at", "post_id")[cap - 1:cap])
+    if not oldest:
+        return 0
+    created_at, post_id = oldest[0]
+    older = Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lt=post_id)
+    deleted, _ = TimelineEntry.objects.filter(older, user=user_id).delete()
+    return deleted
+
+
+def mark_fanned_out():
+    """Flag the posts of authors within FANOUT_MAX_FOLLOWERS as pushed and the rest as pulled"""
+    pushed = User.all_objects.filter(id=OuterRef("owner_id"), follower_count__lte=settings.FANOUT_MAX_FOLLOWERS)
+    return Post.all_objects.update(fanned_out=Exists(pushed))
+
+
+def inbox(user_id):
+    """The user's timeline entries of live, ready posts"""
+    return TimelineEntry.objects.filter(user=user_id, post__status=Post.READY, post__deleted_at__isnull=True,
+                                        post__owner__deleted_at__isnull=True)
+
+
+def pulled(user_id):
+    """Ready posts of followed authors that were never pushed into timelines"""
+    followed = Follow.objects.filter(following=user_id).values("followed")
+    return Post.objects.filter(owner__in=followed, fanned_out=False, status=Post.READY)
+
+
+def feed_filter(user_id):
+    """The whole feed as a filter on posts, for reads that go past a page"""
+    return Q(id__in=inbox(user_id).values("post")) | Q(id__in=pulled(user_id).values("id"))
@@ -0,0 +1,103 @@
+"""
+Time-decayed engagement scores for the explore feed.
+
+The trending score of a post is log2 of the sum, over its creation, likes and comments,
+of weight * 2 ** ((time - EPOCH) / half life). Measuring every event from a fixed epoch
+rather than from now leaves the scores in the same order as the engagement decayed to
+the present, so a score only changes when its post gains or loses engagement. A post
+starts with the score of its creation alone, and a run rescores every post created in the
+last TRENDING_WINDOW_HOURS, which catches removed likes and comments, along with older
+posts liked or commented on since the last run.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import Post, Like, Comment
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def half_lives(moment):
+    """Half lives from EPOCH to `moment`"""
+    return (moment - EPOCH).total_seconds() / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def new_post_score(created_at):
+    """Trending score of a post created at `created_at` without any engagement yet"""
+    return half_lives(created_at) + float(np.log2(settings.TRENDING_POST_WEIGHT))
+
+
+def hourly(model, post_ids):
+    """(post id, hour, count) of the likes or comments on `post_ids`"""
+    return (model.objects.filter(post__in=post_ids).order_by().annotate(hour=TruncHour("created_at"))
+            .values_list("post_id", "hour").annotate(count=Count("id")))
+
+
+def scores(posts):
+    """Trending score of every (id, created_at) in `posts` from all of its likes and comments"""
+    index = {post_id: position for position, (post_id, _) in enumerate(posts)}
+    events = [(position, half_lives(created_at), settings.TRENDING_POST_WEIGHT)
+              for position, (_, created_at) in enumerate(posts)]
+    for model, weight in ((Like, settings.TRENDING_LIKE_WEIGHT), (Comment, settings.TRENDING_COMMENT_WEIGHT)):
+        # Grouped by hour so a viral post costs rows per hour of activity, not per like
+        events.extend((index[post_id], half_lives(hour), weight * count)
+                      for post_id, hour, count in hourly(model, list(index)))
+    positions, exponents, weights = (np.array(column) for column in zip(*events))
+    # Sum the powers of two relative to each post's largest exponent so none of them overflows
+    top = np.full(len(posts), -np.inf)
+    np.maximum.at(top, positions, exponents)
+    sums = np.zeros(len(posts))
+    np.add.at(sums, positions, weights * np.exp2(exponents - top[positions]))
+    return top + np.log2(sums)
+
+
+def rescore(post_ids, scored_at):
+    posts = list(Post.objects.filter(id__in=post_ids).values_list("id", "created_at"))
+    if posts:
+        Post.objects.bulk_update([Post(id=post_id, trending_score=float(score), scored_at=scored_at)
+                                  for (post_id, _), score in zip(posts, scores(posts))],
+                                 ["trending_score", "scored_at"])
+    return len(posts)
+
+
+def touched_since(since, window_start):
+    """Ids of the posts created from `window_start` on, or liked or commented on from `since` on"""
+    post_ids = set(Post.objects.filter(created_at__gte=min(since, window_start)).values_list("id", flat=True))
+    for model in (Like, Comment):
+        post_ids.update(model.objects.filter(created_at__gte=since).order_by()
+                        .values_list("post_id", flat=True).distinct())
+    return sorted(post_ids)
+
+
+def all_posts(batch_size):
+    """Every post id, read in primary key pages so rescoring never writes under an open cursor"""
+    last_id = 0
+    while True:
+        post_ids = list(Post.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not post_ids:
+            return
+        yield from post_ids
+        last_id = post_ids[-1]
+
+
+def refresh(batch_size, full=False):
+    """Rescore the posts in the window and those with new engagement since the last run, or all of them, returns how many"""
+    started = timezone.now()
+    last_run = Post.objects.aggregate(last_run=Max("scored_at"))["last_run"]
+    if full or last_run is None:
+        post_ids = all_posts(batch_size)
+    else:
+        post_ids = touched_since(last_run - timedelta(seconds=settings.TRENDING_OVERLAP_SECONDS),
+                                 started - timedelta(hours=settings.TRENDING_WINDOW_HOURS))
+
+    rescored, batch = 0, []
+    for post_id in post_ids:
+        batch.append(post_id)
+        if len(batch) == batch_size:
+            rescored += rescore(batch, started)
+            batch = []
+    return rescored + rescore(batch, started)
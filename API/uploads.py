@@ -0,0 +1,133 @@
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from cloudinary import uploader
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Post, PendingUpload
+
+
+class UploadBackend:
+    """Pushes a staged file to permanent storage and returns the value to store in the field"""
+
+    def upload(self, path, field):
+        raise NotImplementedError
+
+
+class CloudinaryBackend(UploadBackend):
+    def upload(self, path, field):
+        options = {"type": field.type, "resource_type": field.resource_type, **field.options}
+        return uploader.upload_resource(str(path), **options).get_prep_value()
+
+
+class LocalBackend(UploadBackend):
+    """Copies files under UPLOAD_LOCAL_ROOT, a stand-in for Cloudinary in development and tests"""
+
+    def upload(self, path, field):
+        root = Path(settings.UPLOAD_LOCAL_ROOT)
+        root.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, root / path.name)
+        return f"{field.resource_type}/{field.type}/{path.name}"
+
+
+def get_backend():
+    return import_string(settings.UPLOAD_BACKEND)()
+
+
+def is_file(value):
+    return isinstance(value, UploadedFile)
+
+
+def defer(instance, field, file):
+    """Stage an uploaded file on disk and queue it for the worker"""
+    staging = Path(settings.UPLOAD_STAGING_DIR)
+    staging.mkdir(parents=True, exist_ok=True)
+    path = staging / f"{uuid.uuid4().hex}{Path(file.name).suffix}"
+    with open(path, "wb") as destination:
+        for chunk in file.chunks():
+            destination.write(chunk)
+    target = {"post": instance} if isinstance(instance, Post) else {"user": instance}
+    return PendingUpload.objects.create(field=field, path=str(path), **target)
+
+
+def claim(batch_size):
+    """Lease a batch of due uploads so concurrent workers do not process them twice"""
+    now = timezone.now()
+    with transaction.atomic():
+        uploads = list(PendingUpload.objects.select_for_update(skip_locked=True)
+                       .select_related("post", "user")
+                       .filter(status=PendingUpload.PENDING, next_attempt_at__lte=now)
+                       .order_by("next_attempt_at")[:batch_size])
+        PendingUpload.objects.filter(id__in=[upload.id for upload in uploads]).update(
+            next_attempt_at=now + timedelta(seconds=settings.UPLOAD_LEASE_SECONDS))
+    return uploads
+
+
+def _finish(upload, value):
+    target = upload.target
+    setattr(target, upload.field, value)
+    update_fields = [upload.field]
+    if upload.post_id:
+        target.status = Post.READY
+        update_fields.append("status")
+    with transaction.atomic():
+        target.save(update_fields=update_fields)
+        upload.status = PendingUpload.DONE
+        upload.save(update_fields=["status"])
+    Path(upload.path).unlink(missing_ok=True)
+
+
+def _failed(upload, error):
+    upload.attempts += 1
+    upload.last_error = str(error)
+    if upload.attempts >= settings.UPLOAD_MAX_ATTEMPTS:
+        upload.status = PendingUpload.FAILED
+        if upload.post_id:
+            upload.post.status = Post.FAILED
+            upload.post.save(update_fields=["status"])
+    else:
+        delay = settings.UPLOAD_BACKOFF_SECONDS * 2 ** upload.attempts
+        upload.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    upload.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def process(upload, backend):
+    """Store one staged file, returns True when it succeeded"""
+    field = upload.target._meta.get_field(upload.field)
+    try:
+        value = backend.upload(Path(upload.path), field)
+    except Exception as error:
+        _failed(upload, error)
+        return False
+    _finish(upload, value)
+    return True
+
+
+def _process_in_thread(upload, backend):
+    try:
+        return process(upload, backend)
+    finally:
+        # Each pool thread opens its own connection
+        connection.close()
+
+
+def process_batch(batch_size=None, concurrency=None):
+    """Upload one batch of due files on a thread pool, returns (done, failed)"""
+    uploads = claim(batch_size or settings.UPLOAD_BATCH_SIZE)
+    if not uploads:
+        return 0, 0
+    backend = get_backend()
+    concurrency = concurrency or settings.UPLOAD_CONCURRENCY
+    if concurrency == 1:
+        results = [process(upload, backend) for upload in uploads]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda upload: _process_in_thread(upload, backend), uploads))
+    done = sum(results)
+    return done, len(results) - done
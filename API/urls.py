@@ -1,25 +1,43 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from . import views
+from rest_framework_simplejwt.views import TokenRefreshView
+from . import views, async_views
 
 urlpatterns = [
     path("user", view=views.CreateUserView.as_view(), name="create_user"), 
     path("user/<int:pk>", view=views.RetrieveUserAPIView.as_view(), name="user_profile"), 
+    path("user/<int:pk>/posts", view=views.UserPostsAPIView.as_view(), name="user_posts"),
+    path("user/<int:pk>/followers", view=views.UserFollowersAPIView.as_view(), name="user_followers"),
+    path("user/<int:pk>/following", view=views.UserFollowingAPIView.as_view(), name="user_following"),
     path("user/<int:pk>/update", view=views.UpdateUserAPIView.as_view(), name="update_profile"),
+    path("user/<int:pk>/delete", view=views.DeleteUserAPIView.as_view(), name="delete_user"),
     path("user/<int:pk>/avatar/update", view=views.UpdateAvatarAPIView.as_view(), name="update_avatar"),
+    path("user/export", view=views.ExportAPIView.as_view(), name="user_export"),
     path("users", view=views.ListUsersAPIView.as_view(), name="list_users"),
+    path("users/suggestions", view=views.SuggestionsAPIView.as_view(), name="user_suggestions"),
+    path("users/cache-stats", view=views.ProfileCacheStatsAPIView.as_view(), name="profile_cache_stats"),
+    path("metrics", view=views.MetricsAPIView.as_view(), name="metrics"),
 
     path("posts", view=views.CreateListPostView.as_view(), name="posts"),
     path("post/<int:pk>", view=views.DeleteUpdatePostView.as_view(), name="post_update_delete"),
     path("post/<int:pk>/comments", views.CreateListCommentsAPIView.as_view(), name="comments"),
     path("post/<int:pk>/like", views.CreateLikeAPIView.as_view(), name="add_like"),
     path("post/<int:pk>/unlike", views.RemoveLike.as_view(), name="remove_like"),
+    path("posts/like", views.BatchLikeAPIView.as_view(), name="batch_like"),
+    path("posts/unlike", views.BatchUnlikeAPIView.as_view(), name="batch_unlike"),
     path("feed", view=views.FeedAPIView.as_view(), name="user_feed"),
+    path("explore", view=views.ExploreAPIView.as_view(), name="explore"),
 
     path("follow", views.FollowUser.as_view(), name="follow_user"),
     path("unfollow/<int:pk>", views.UnFollowUserAPIView.as_view(), name="unfollow_user"),
+    path("follow/batch", views.BatchFollowAPIView.as_view(), name="batch_follow"),
+    path("unfollow/batch", views.BatchUnfollowAPIView.as_view(), name="batch_unfollow"),
 
-    path("token", TokenObtainPairView.as_view(), name="auth_token"),
+    path("async/feed", async_views.feed, name="async_user_feed"),
+    path("async/user/<int:pk>", async_views.profile, name="async_user_profile"),
+    path("async/post/<int:pk>", async_views.post_detail, name="async_post_detail"),
+    path("async/post/<int:pk>/comments", async_views.comments, name="async_comments"),
+
+    path("token", views.ObtainTokenView.as_view(), name="auth_token"),
     path("token/refresh", TokenRefreshView.as_view(), name="refresh_token"),
     path("request-reset", views.RequestPasswordReset.as_view(), name="request_password_reset"),
     path("reset-password", views.ResetPasswordAPIView.as_view(), name="reset_password")
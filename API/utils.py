@@ -1,12 +1,20 @@
-from django.core.mail import EmailMessage
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import OutboxEmail
 
 
 class Util:
     def send_mail(data):
-        email = EmailMessage(
+        """Queue an email in the outbox, the send_outbox worker delivers it"""
+        OutboxEmail.objects.create(
             subject=data["subject"],
             body=data["body"],
-            to=[data["recipient"]]
+            recipient=data["recipient"]
         )
-        email.send()
 
+
+def count_of(model, field):
+    """Correlated subquery counting `model` rows whose `field` points at the outer row"""
+    rows = (model.objects.filter(**{field: OuterRef("pk")}).order_by()
+            .values(field).annotate(total=Count("pk")).values("total"))
+    return Coalesce(Subquery(rows), 0)
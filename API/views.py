@@ -1,21 +1,148 @@
 from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework.generics import get_object_or_404
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import ValidationError, NotFound
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.encoding import smart_str, smart_bytes, DjangoUnicodeDecodeError
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.db import transaction, router, IntegrityError
+from django.db.models import Prefetch, F
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.text import compress_sequence
+from django.utils.crypto import constant_time_compare
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+import hashlib
 import os
 from .utils import Util
-from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
-from .models import User, Post, Comment, Like, Follow
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly, IsAdminUser, BasePermission
+from .models import User, Post, Comment, Like, Follow, Suggestion
+from .authentication import CachedJWTAuthentication
+from .pagination import KeysetPagination, FeedPagination, SearchPagination, CommentPagination, TrendingPagination
+from .search import search_users
+from . import timeline, uploads, metrics, export, reaper, trending
+from .cache import (get_profile, set_profile, profile_cache_stats, invalidate_profiles, bump_versions, get_versions,
+                    is_shared, version_stamp, SHOWN_USER)
+from .utils import count_of
+from .routers import reading_from
+from .serializers import is_compact, is_expanded, is_streamed, profile_variant
+from .renderers import NDJSONRenderer, FallbackContentNegotiation, batched, stream_json
+from .projections import Projector, POST_COLUMNS, COMMENT_COLUMNS, FOLLOW_COLUMNS, TRENDING_COLUMNS
 from .serializers import (UserSerializer, PostSerializer, UpdateUserSerializer, CommentSerializer, 
                           LikeSerializer, FollowSerializer, SimpleUserSerializer, UpdateAvatarSerializer,
-                          ResetPasswordSerializer, NewPasswordSerializer
+                          ResetPasswordSerializer, NewPasswordSerializer, BatchSerializer, ProfileSerializer,
+                          SuggestionSerializer
 )
 
 # Create your views here.
 
+def in_request(content, model):
+    """
+    `content` read, once the middlewares have returned, from the database the request reads
+    `model` from and with its metrics: a stream stays on one replica, or on the primary for a
+    pinned user, and its queries count towards the request.
+    """
+    alias = router.db_for_read(model)
+    request_metrics = metrics.current.get()
+
+    def read():
+        with reading_from(alias), metrics.measuring(request_metrics):
+            yield from content
+    return read()
+
+
+def shown_in_posts(rows, compact=False):
+    """Ids of the users post rows show: their owners and, unless compact, the authors of their comment previews"""
+    users = {row["owner_id"] for row in rows}
+    if not compact:
+        post_ids = [row["id"] for row in rows]
+        users.update(Comment.objects.filter(post_id__in=post_ids).latest_per_post().values_list("owner_id", flat=True))
+    return users
+
+
+def digest(*parts):
+    return hashlib.md5("|".join(map(str, parts)).encode(), usedforsecurity=False).hexdigest()
+
+
+class ConditionalGetMixin:
+    """
+    Answers GET with 304 Not Modified when If-None-Match/If-Modified-Since match
+    the version returned by get_version(), before anything is serialized. Versions
+    are stamps kept in the cache, so this is only done when every worker shares it.
+    """
+    version = None
+
+    def get_version(self):
+        """(etag, last modified timestamp or None) of the requested resource, None to decide later"""
+        raise NotImplementedError
+
+    def uses_versions(self):
+        # A stream reaches past the page the version describes
+        return is_shared() and not is_streamed(self.get_serializer_context())
+
+    def not_modified(self, version):
+        """A 304 response when the request already has `version`, None otherwise"""
+        self.version = version
+        etag, last_modified = version
+        return get_conditional_response(self.request, etag=quote_etag(etag),
+                                        last_modified=int(last_modified) if last_modified else None)
+
+    def get(self, request, *args, **kwargs):
+        response = None
+        if self.uses_versions():
+            version = self.get_version()
+            if version is not None:
+                response = self.not_modified(version)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if self.version is not None and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            etag, last_modified = self.version
+            response["ETag"] = quote_etag(etag)
+            if last_modified:
+                response["Last-Modified"] = http_date(int(last_modified))
+        return response
+
+
+class ProjectedListMixin:
+    """Serves list requests from values() rows through a Projector instead of the serializer"""
+    projected_columns = POST_COLUMNS
+
+    def project(self, projector, rows):
+        return projector.posts(rows)
+
+    def check_page(self, page):
+        """A response to send instead of the fetched page, e.g. a 304, or None"""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*self.projected_columns)
+        projector = Projector(compact=is_compact(self.get_serializer_context()))
+        if is_streamed(self.get_serializer_context()):
+            return self.stream(projector, queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.check_page(page)
+            if response is not None:
+                return response
+            return self.get_paginated_response(self.project(projector, page))
+        return Response(self.project(projector, queryset))
+
+    def stream(self, projector, queryset):
+        """
+        The list from the requested cursor on, up to STREAM_MAX_ROWS, as one JSON array.
+        Rows are read and encoded STREAM_CHUNK_SIZE at a time while the response is sent.
+        """
+        if self.paginator is not None:
+            queryset = self.paginator.get_ordered_queryset(queryset, self.request)
+        rows = queryset[:settings.STREAM_MAX_ROWS].iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
+        chunks = (self.project(projector, chunk) for chunk in batched(rows, settings.STREAM_CHUNK_SIZE))
+        return StreamingHttpResponse(in_request(stream_json(chunks), queryset.model), content_type="application/json")
+
+
 class CreateUserView(generics.CreateAPIView):
     queryset = User.objects.select_related().all()
     serializer_class = UserSerializer
@@ -23,19 +150,146 @@ class CreateUserView(generics.CreateAPIView):
 
 
 class ListUsersAPIView(generics.ListAPIView):
-    queryset = User.objects.select_related().all()
     serializer_class = SimpleUserSerializer
     permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTStatelessUserAuthentication]
+    pagination_class = SearchPagination
 
     def get_queryset(self):
-        query = self.request.query_params.get("username") if self.request.query_params.get("username") != None else ""
-        return User.objects.filter(username__icontains=query)
+        query = self.request.query_params.get("username", "")
+        include_bio = self.request.query_params.get("bio", "").lower() in ("1", "true")
+        return search_users(query, include_bio=include_bio)
 
 
-class RetrieveUserAPIView(generics.RetrieveAPIView):
-    serializer_class = UserSerializer
+class RetrieveUserAPIView(ConditionalGetMixin, generics.RetrieveAPIView):
+    """Profile summary, or with ?expand=true the profile with every post and follow embedded"""
+    serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTStatelessUserAuthentication]
     queryset = User.objects.all()
+    expanded_queryset = User.objects.prefetch_related(
+        Prefetch("posts", queryset=Post.objects.with_details()),
+        Prefetch("followers", queryset=Follow.objects.select_related("following")),
+        Prefetch("followings", queryset=Follow.objects.select_related("following")),
+    )
+
+    def get_queryset(self):
+        if is_expanded(self.get_serializer_context()):
+            return self.expanded_queryset.all()
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        return UserSerializer if is_expanded(self.get_serializer_context()) else ProfileSerializer
+
+    def get_version(self):
+        user_id = self.kwargs["pk"]
+        variant = profile_variant(self.get_serializer_context())
+        # The users an expanded profile shows are only known from its cached payload, see retrieve
+        if variant != "summary":
+            return None
+        # A version is only stamped for a user that exists
+        if not User.objects.filter(id=user_id).exists():
+            raise NotFound("No User matches the given query.")
+        version = get_versions("user", [user_id])[user_id]
+        return f"user-{user_id}-{variant}-{version}", version
+
+    def retrieve(self, request, *args, **kwargs):
+        user_id = self.kwargs["pk"]
+        variant = profile_variant(self.get_serializer_context())
+        entry = get_profile(user_id, variant)
+        if entry is None:
+            payload = self.get_serializer(self.get_object()).data
+            shown = set_profile(user_id, variant, payload)
+        else:
+            payload, shown = entry
+        if self.version is None and self.uses_versions():
+            version = get_versions("user", [user_id])[user_id]
+            response = self.not_modified((f"user-{user_id}-{variant}-{version}-{digest(version_stamp(shown))}",
+                                          max([version, *shown.values()])))
+            if response is not None:
+                return response
+        return Response(payload)
+
+
+class UserPostsAPIView(ProjectedListMixin, generics.ListAPIView):
+    """A user's posts, newest first, keyset paged over the (owner, created_at) index"""
+    serializer_class = PostSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTStatelessUserAuthentication]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        owner_id = self.kwargs["pk"]
+        posts = Post.objects.filter(owner=owner_id)
+        if owner_id != self.request.user.id:
+            # Posts still waiting for their image are only shown to their owner
+            posts = posts.filter(status=Post.READY)
+        return posts
+
+
+class UserFollowersAPIView(ProjectedListMixin, generics.ListAPIView):
+    """The users following a user, latest first, keyset paged over the (followed, created_at) index"""
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTStatelessUserAuthentication]
+    pagination_class = KeysetPagination
+    projected_columns = FOLLOW_COLUMNS
+
+    def get_queryset(self):
+        return Follow.objects.filter(followed=self.kwargs["pk"])
+
+    def project(self, projector, rows):
+        return projector.follows(rows, "following_id")
+
+
+class UserFollowingAPIView(UserFollowersAPIView):
+    """The users a user follows, latest first, keyset paged over the (following, created_at) index"""
+
+    def get_queryset(self):
+        return Follow.objects.filter(following=self.kwargs["pk"])
+
+    def project(self, projector, rows):
+        return projector.follows(rows, "followed_id")
+
+
+class SuggestionsAPIView(generics.ListAPIView):
+    """Who to follow, as ranked by compute_suggestions, without the users followed since"""
+    serializer_class = SuggestionSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTStatelessUserAuthentication]
+
+    def get_queryset(self):
+        user_id = self.request.user.id
+        followed = Follow.objects.filter(following=user_id).values("followed_id")
+        return (Suggestion.objects.filter(user=user_id, suggested__deleted_at__isnull=True)
+                .exclude(suggested__in=followed)
+                .select_related("suggested").order_by("rank"))
+
+
+class ProfileCacheStatsAPIView(generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+    # is_staff is not among the cached principal fields
+    authentication_classes = [JWTAuthentication]
+
+    def get(self, request):
+        return Response(profile_cache_stats(), status=status.HTTP_200_OK)
+
+
+class HasMetricsToken(BasePermission):
+    """The request carries METRICS_TOKEN as a bearer token, or no token is set and DEBUG is on"""
+
+    def has_permission(self, request, view):
+        if not settings.METRICS_TOKEN:
+            return settings.DEBUG
+        return constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}")
+
+
+class MetricsAPIView(generics.GenericAPIView):
+    """Request metrics of this process in the Prometheus text format"""
+    authentication_classes = []
+    permission_classes = [HasMetricsToken]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 class UpdateUserAPIView(generics.UpdateAPIView):
@@ -46,6 +300,17 @@ class UpdateUserAPIView(generics.UpdateAPIView):
         return User.objects.filter(id=self.request.user.id)
 
 
+class DeleteUserAPIView(generics.DestroyAPIView):
+    """Hides the account at once, the reap command deletes it and everything it made"""
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return User.objects.filter(id=self.request.user.id)
+
+    def perform_destroy(self, instance):
+        reaper.tombstone(instance)
+
+
 class UpdateAvatarAPIView(generics.UpdateAPIView):
     serializer_class = UpdateAvatarSerializer
     permission_classes = [IsAuthenticated]
@@ -53,50 +318,132 @@ class UpdateAvatarAPIView(generics.UpdateAPIView):
     def get_queryset(self):
         return User.objects.filter(id=self.request.user.id)
 
-class CreateListPostView(generics.ListCreateAPIView):
+    def perform_update(self, serializer):
+        # The current avatar is kept until the worker has stored the new one
+        avatar = serializer.validated_data.get("avatar")
+        if uploads.is_file(avatar):
+            uploads.defer(serializer.instance, "avatar", serializer.validated_data.pop("avatar"))
+        serializer.save()
+
+class CreateListPostView(ProjectedListMixin, generics.ListCreateAPIView):
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    authentication_classes = [CachedJWTAuthentication]
 
     def get_queryset(self):
         owner = self.request.user
-        posts = Post.objects.filter(owner=owner.id)
+        posts = Post.objects.with_details().filter(owner=owner.id)
         return posts
     
     def perform_create(self, serializer):
         if serializer.is_valid():
-            serializer.save(owner=self.request.user)
+            image = serializer.validated_data.get("image")
+            # Ranked in explore by its recency until score_trending rescores it
+            serializer.validated_data["trending_score"] = trending.new_post_score(timezone.now())
+            if uploads.is_file(image):
+                # Acknowledge right away, the worker stores the image and marks the post ready
+                serializer.validated_data["image"] = ""
+                post = serializer.save(owner_id=self.request.user.id, status=Post.PROCESSING)
+                uploads.defer(post, "image", image)
+            else:
+                post = serializer.save(owner_id=self.request.user.id)
+            timeline.fan_out(post)
             return Response({"detail": "Created successfully"}, status=status.HTTP_201_CREATED)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class FeedAPIView(generics.ListAPIView):
+class FeedAPIView(ConditionalGetMixin, ProjectedListMixin, generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTStatelessUserAuthentication]
+    pagination_class = FeedPagination
+    explore = False
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Someone who follows nobody gets the explore feed rather than every post ever
+        if not self.explore and not Follow.objects.filter(following=request.user.id).exists():
+            self.explore = True
+        if self.explore:
+            self.pagination_class = TrendingPagination
+            self.projected_columns = TRENDING_COLUMNS
+
+    def get_version(self):
+        # Decided by check_page from the page list() fetches
+        return None
+
+    def check_page(self, page):
+        # The stamp changes when the page gains or loses a post or when any post on it changes
+        if not self.uses_versions():
+            return None
+        post_ids = [row["id"] for row in page]
+        versions = get_versions("post", post_ids)
+        stamp = "|".join(f"{post_id}:{versions[post_id]}" for post_id in post_ids)
+        shown = get_versions(SHOWN_USER, shown_in_posts(page, is_compact(self.get_serializer_context())))
+        page_digest = digest(self.request.get_full_path(), stamp, version_stamp(shown))
+        # No Last-Modified: a post leaving the page does not move the newest version forward
+        return self.not_modified((f"feed-{self.request.user.id}-{page_digest}", None))
 
     def get_queryset(self):
-        user = self.request.user
-        following_users = Follow.objects.filter(following=user).values_list('followed', flat=True)
-        if not following_users:
-            return Post.objects.all()
-        return Post.objects.filter(owner__in=following_users)
-        
+        # Which posts make the feed is decided by paginate_queryset, or stream
+        return Post.objects.with_details().filter(status=Post.READY)
+
+    def paginate_queryset(self, queryset):
+        if self.explore:
+            return super().paginate_queryset(queryset)
+        user_id = self.request.user.id
+        return self.paginator.paginate_feed(queryset, timeline.inbox(user_id), timeline.pulled(user_id), self.request)
+
+    def stream(self, projector, queryset):
+        if not self.explore:
+            queryset = queryset.filter(timeline.feed_filter(self.request.user.id))
+        return super().stream(projector, queryset)
+
+
+class ExploreAPIView(FeedAPIView):
+    """Posts ranked by engagement decayed over time, as scored by score_trending"""
+    explore = True
+
 
-class DeleteUpdatePostView(generics.RetrieveUpdateDestroyAPIView):
+class DeleteUpdatePostView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
-    queryset = Post.objects.select_related().all()
+    queryset = Post.objects.with_details()
+
+    def get_version(self):
+        post_id = self.kwargs["pk"]
+        # A version is only stamped for a post that exists
+        rows = list(Post.objects.filter(id=post_id).values("id", "owner_id"))
+        if not rows:
+            raise NotFound("No Post matches the given query.")
+        compact = is_compact(self.get_serializer_context())
+        variant = "compact" if compact else "full"
+        version = get_versions("post", [post_id])[post_id]
+        # The post also changes with the users it shows
+        shown = get_versions(SHOWN_USER, shown_in_posts(rows, compact))
+        return (f"post-{post_id}-{variant}-{version}-{digest(version_stamp(shown))}",
+                max([version, *shown.values()]))
+
+    def perform_destroy(self, instance):
+        reaper.tombstone(instance)
   
     
 # Comments
 
-class CreateListCommentsAPIView(generics.ListCreateAPIView):
+class CreateListCommentsAPIView(ProjectedListMixin, generics.ListCreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    authentication_classes = [CachedJWTAuthentication]
+    pagination_class = CommentPagination
+    projected_columns = COMMENT_COLUMNS
+
+    def project(self, projector, rows):
+        return projector.comments(rows)
     
     def get_queryset(self):
         post = self.kwargs['pk']
-        return Comment.objects.filter(post=post).all()
+        return Comment.objects.filter(post=post)
     
     def perform_create(self, serializer):
         post_id = self.kwargs["pk"]
@@ -105,8 +452,9 @@ class CreateListCommentsAPIView(generics.ListCreateAPIView):
         except Post.DoesNotExist:
             raise ValidationError({"detail": "Post doesn't exist"})
         if serializer.is_valid():
-            owner = self.request.user
-            serializer.save(post=post, owner=owner)
+            with transaction.atomic():
+                serializer.save(post=post, owner_id=self.request.user.id)
+                Post.objects.filter(id=post.id).update(comment_count=F("comment_count") + 1)
             return Response({"detail": "Comment added"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -114,27 +462,34 @@ class CreateListCommentsAPIView(generics.ListCreateAPIView):
 class CreateLikeAPIView(generics.CreateAPIView):
     serializer_class = LikeSerializer
     permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    throttle_scope = "like"
     queryset = Like.objects.all()
     
     def perform_create(self, serializer):
-        owner = self.request.user
+        owner_id = self.request.user.id
         post_id = self.kwargs["pk"]
-        
-        if Like.objects.filter(owner=owner, post_id=post_id).exists():
-            raise ValidationError({"detail": "You have already liked this post"})
-        
-        post = Post.objects.get(id=post_id)
-        serializer.save(post=post, owner=owner)
+
+        # As in FollowUser, a repeat rolls back the counter it moved
+        with transaction.atomic():
+            if not Post.objects.filter(id=post_id).update(like_count=F("like_count") + 1):
+                raise NotFound({"detail": "Post doesn't exist"})
+            like, created = Like.objects.get_or_create(post_id=post_id, owner_id=owner_id)
+            if not created:
+                raise ValidationError({"detail": "You have already liked this post"})
+        serializer.instance = like
 
 
 class RemoveLike(generics.DestroyAPIView):
     serializer_class = LikeSerializer
     permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    throttle_scope = "like"
     
     def get_queryset(self):
-        user = self.request.user
+        user_id = self.request.user.id
         post_id = self.kwargs["pk"]
-        queryset = Like.objects.filter(post_id=post_id, owner=user)
+        queryset = Like.objects.filter(post_id=post_id, owner=user_id)
         return queryset
     
     def get_object(self):
@@ -143,26 +498,47 @@ class RemoveLike(generics.DestroyAPIView):
         self.check_object_permissions(self.request, obj)
 
         return obj
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Post.objects.filter(id=instance.post_id).update(like_count=F("like_count") - 1)
     
 
 class FollowUser(generics.CreateAPIView):
     serializer_class = FollowSerializer
     permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    throttle_scope = "follow"
     queryset = Follow.objects.all()
 
     def perform_create(self, serializer):
         user = self.request.user
-        followed_id = self.request.data["follow_id"]
-        if Follow.objects.filter(following__id=user.id, followed__id=followed_id).exists():
+        try:
+            followed_id = int(self.request.data["follow_id"])
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError({"follow_id": "A user id is required"})
+        # As in BatchFollowAPIView, a self-follow would count the user among their own followers
+        if followed_id == user.id:
+            raise ValidationError({"detail": "You cannot follow yourself"})
+
+        # The unique (followed, following) constraint rejects repeats, rolling back the counters too
+        try:
+            with transaction.atomic():
+                if not User.objects.filter(id=followed_id).update(follower_count=F("follower_count") + 1):
+                    raise NotFound({"detail": "User doesn't exist"})
+                serializer.save(following_id=user.id, followed_id=followed_id)
+                User.objects.filter(id=user.id).update(following_count=F("following_count") + 1)
+        except IntegrityError:
             raise ValidationError({"detail": "Already follows this user"})
-        
-        followed = User.objects.get(id=followed_id)
-        serializer.save(following=user, followed=followed)
+        timeline.backfill(user.id, followed_id)
 
 
 class UnFollowUserAPIView(generics.DestroyAPIView):
     serializer_class = FollowSerializer
     permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    throttle_scope = "follow"
 
     def get_queryset(self):
         following = self.request.user
@@ -177,9 +553,130 @@ class UnFollowUserAPIView(generics.DestroyAPIView):
 
         return obj
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            User.objects.filter(id=instance.followed_id).update(follower_count=F("follower_count") - 1)
+            User.objects.filter(id=instance.following_id).update(following_count=F("following_count") - 1)
+            timeline.prune(instance.following_id, instance.followed_id)
+
+
+class BatchLikeAPIView(generics.GenericAPIView):
+    serializer_class = BatchSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    throttle_scope = "like"
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        posts = Post.objects.filter(id__in=serializer.validated_data["ids"])
+        likes = [Like(post_id=post_id, owner_id=request.user.id) for post_id in posts.values_list("id", flat=True)]
+        with transaction.atomic():
+            Like.objects.bulk_create(likes, ignore_conflicts=True)
+            posts.update(like_count=count_of(Like, "post"))
+            # bulk_create skips the post_save signals that normally do this
+            invalidate_profiles(*posts.values_list("owner_id", flat=True))
+            bump_versions("post", [like.post_id for like in likes])
+        return Response({"detail": "Posts liked"}, status=status.HTTP_200_OK)
+
+
+class BatchUnlikeAPIView(generics.GenericAPIView):
+    serializer_class = BatchSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    throttle_scope = "like"
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        post_ids = serializer.validated_data["ids"]
+        with transaction.atomic():
+            Like.objects.filter(owner=request.user.id, post_id__in=post_ids).delete()
+            Post.objects.filter(id__in=post_ids).update(like_count=count_of(Like, "post"))
+        return Response({"detail": "Posts unliked"}, status=status.HTTP_200_OK)
+
+
+class BatchFollowAPIView(generics.GenericAPIView):
+    serializer_class = BatchSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    throttle_scope = "follow"
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_id = request.user.id
+        followed_ids = list(User.objects.filter(id__in=serializer.validated_data["ids"])
+                            .exclude(id=user_id).values_list("id", flat=True))
+        follows = [Follow(following_id=user_id, followed_id=followed_id) for followed_id in followed_ids]
+        with transaction.atomic():
+            Follow.objects.bulk_create(follows, ignore_conflicts=True)
+            User.objects.filter(id__in=followed_ids).update(follower_count=count_of(Follow, "followed"))
+            User.objects.filter(id=user_id).update(following_count=count_of(Follow, "following"))
+            # bulk_create skips the post_save signals that normally do this
+            invalidate_profiles(user_id, *followed_ids)
+        for followed_id in followed_ids:
+            timeline.backfill(user_id, followed_id)
+        return Response({"detail": "Users followed"}, status=status.HTTP_200_OK)
+
+
+class BatchUnfollowAPIView(generics.GenericAPIView):
+    serializer_class = BatchSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    throttle_scope = "follow"
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_id = request.user.id
+        followed_ids = serializer.validated_data["ids"]
+        with transaction.atomic():
+            Follow.objects.filter(following=user_id, followed_id__in=followed_ids).delete()
+            User.objects.filter(id__in=followed_ids).update(follower_count=count_of(Follow, "followed"))
+            User.objects.filter(id=user_id).update(following_count=count_of(Follow, "following"))
+            for followed_id in followed_ids:
+                timeline.prune(user_id, followed_id)
+        return Response({"detail": "Users unfollowed"}, status=status.HTTP_200_OK)
+
+
+class ExportAPIView(generics.GenericAPIView):
+    """
+    The requesting user's data as NDJSON, gzipped when the client accepts it. Every line
+    carries a cursor, requesting ?cursor=<the last one received> resumes after it.
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    renderer_classes = [NDJSONRenderer]
+    content_negotiation_class = FallbackContentNegotiation
+    throttle_scope = "export"
+
+    def get(self, request):
+        cursor = request.query_params.get("cursor")
+        try:
+            export.parse_cursor(cursor)
+        except ValueError:
+            raise NotFound("Invalid cursor")
+        chunks = in_request(export.chunks(export.lines(request.user.id, cursor)), User)
+        gzipped = "gzip" in request.headers.get("Accept-Encoding", "")
+        response = StreamingHttpResponse(compress_sequence(chunks) if gzipped else chunks,
+                                         content_type=NDJSONRenderer.media_type)
+        if gzipped:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        response["Content-Disposition"] = f'attachment; filename="instapet-{request.user.id}.ndjson"'
+        return response
+
+
+class ObtainTokenView(TokenObtainPairView):
+    throttle_scope = "auth"
+
 
 class RequestPasswordReset(generics.GenericAPIView):
     serializer_class = ResetPasswordSerializer
+    throttle_scope = "reset"
+
     def post(self, request):
         email = request.data.get('email', "")
 
@@ -196,6 +693,7 @@ class RequestPasswordReset(generics.GenericAPIView):
 
 class ResetPasswordAPIView(generics.GenericAPIView):
     serializer_class = NewPasswordSerializer
+    throttle_scope = "reset"
 
     def patch(self, request):
         serializer = self.serializer_class(data=request.data)
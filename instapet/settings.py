@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = "API.User"
 
 MIDDLEWARE = [
+    'API.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -67,6 +68,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'API.middleware.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'instapet.urls'
@@ -95,19 +97,82 @@ WSGI_APPLICATION = 'instapet.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': os.getenv("DATABASE_ENGINE", 'django.db.backends.sqlite3'),
+        'NAME': os.getenv("DATABASE_NAME", BASE_DIR / 'db.sqlite3'),
+        'USER': os.getenv("DATABASE_USER", ""),
+        'PASSWORD': os.getenv("DATABASE_PASSWORD", ""),
+        'HOST': os.getenv("DATABASE_HOST", ""),
+        'PORT': os.getenv("DATABASE_PORT", ""),
     }
 }
 
+# Read replicas: a comma separated list of hosts, or of database files with SQLite,
+# that otherwise share the primary's settings. Tests mirror them onto the primary.
+DATABASE_REPLICAS = [replica for replica in os.getenv("DATABASE_REPLICAS", "").split(",") if replica]
+_replica_key = "NAME" if DATABASES["default"]["ENGINE"].endswith("sqlite3") else "HOST"
+for _index, _replica in enumerate(DATABASE_REPLICAS, 1):
+    DATABASES[f"replica{_index}"] = {**DATABASES["default"], _replica_key: _replica, "TEST": {"MIRROR": "default"}}
+DATABASE_ROUTERS = ["API.routers.ReplicaRouter"]
+
+# Seconds a user's reads stay on the primary after one of their requests wrote
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 5))
+
+# Request metrics: served in the Prometheus text format at API/metrics to holders of METRICS_TOKEN,
+# or to anyone when DEBUG is on and no token is set. Requests slower than SLOW_REQUEST_MS are
+# logged with their SLOW_REQUEST_TOP_QUERIES slowest queries, 0 turns the log off.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").title() == "True"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", 0))
+SLOW_REQUEST_TOP_QUERIES = int(os.getenv("SLOW_REQUEST_TOP_QUERIES", 5))
+
+# Cache
+# A shared backend is required in production so invalidations reach every worker
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 60))
+
+# Deferred uploads: files are staged under UPLOAD_STAGING_DIR, which must be shared with the
+# process_uploads worker, and pushed to UPLOAD_BACKEND in the background
+UPLOAD_BACKEND = os.getenv("UPLOAD_BACKEND", "API.uploads.CloudinaryBackend")
+UPLOAD_STAGING_DIR = Path(os.getenv("UPLOAD_STAGING_DIR", BASE_DIR / "uploads" / "staging"))
+UPLOAD_LOCAL_ROOT = Path(os.getenv("UPLOAD_LOCAL_ROOT", BASE_DIR / "uploads" / "stored"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", 20))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", 5))
+UPLOAD_BACKOFF_SECONDS = int(os.getenv("UPLOAD_BACKOFF_SECONDS", 10))
+UPLOAD_LEASE_SECONDS = int(os.getenv("UPLOAD_LEASE_SECONDS", 300))
+
 # Simple JWT Config
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "ROTATE_REFRESH_TOKENS": True,
-    "BLACKLIST_AFTER_ROTATION": True
+    "BLACKLIST_AFTER_ROTATION": True,
+    "TOKEN_REFRESH_SERIALIZER": "API.serializers.FilteredTokenRefreshSerializer"
 }
 
+# Refresh token blacklist filter: new rows are pulled when a blacklisting is announced, and
+# at least every BLACKLIST_FILTER_TTL seconds in case an announcement is missed, and the whole
+# set is rebuilt every BLACKLIST_FILTER_REBUILD_SECONDS. Each pull reads again the
+# BLACKLIST_FILTER_OVERLAP_IDS ids below the highest one read, which must be more than the
+# rows blacklisted while the longest transaction blacklisting a token commits
+BLACKLIST_FILTER_TTL = int(os.getenv("BLACKLIST_FILTER_TTL", 5))
+BLACKLIST_FILTER_OVERLAP_IDS = int(os.getenv("BLACKLIST_FILTER_OVERLAP_IDS", 1000))
+BLACKLIST_FILTER_REBUILD_SECONDS = int(os.getenv("BLACKLIST_FILTER_REBUILD_SECONDS", 3600))
+TOKEN_PURGE_BATCH_SIZE = int(os.getenv("TOKEN_PURGE_BATCH_SIZE", 1000))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -153,17 +218,105 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # DRF Config
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication"
-    ]
+        "API.authentication.CachedJWTAuthentication"
+    ],
+    # JSON through orjson, the first JSON renderer listed is also used for streamed lists
+    "DEFAULT_RENDERER_CLASSES": [
+        "API.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "API.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    # Token buckets in the default cache, per view throttle_scope: "<scope>.user" limits each
+    # user and "<scope>.ip" each client address. A rate of N/period holds N tokens that refill
+    # over the period.
+    "DEFAULT_THROTTLE_CLASSES": [
+        "API.throttling.UserBucketThrottle",
+        "API.throttling.AddressBucketThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "like.user": os.getenv("THROTTLE_LIKE_USER", "120/min"),
+        "like.ip": os.getenv("THROTTLE_LIKE_IP", "600/min"),
+        "follow.user": os.getenv("THROTTLE_FOLLOW_USER", "60/min"),
+        "follow.ip": os.getenv("THROTTLE_FOLLOW_IP", "300/min"),
+        "auth.ip": os.getenv("THROTTLE_AUTH_IP", "20/min"),
+        "reset.ip": os.getenv("THROTTLE_RESET_IP", "10/hour"),
+        "export.user": os.getenv("THROTTLE_EXPORT_USER", "20/hour"),
+    },
+    # Proxies in front of the app, whose X-Forwarded-For entries are skipped to find the client
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES")) if os.getenv("NUM_PROXIES") else None,
 }
 
+# Seconds a user resolved from an access token is reused, per process and in the shared cache
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", 30))
+PRINCIPAL_LOCAL_MAX_SIZE = int(os.getenv("PRINCIPAL_LOCAL_MAX_SIZE", 10000))
+
+# Pagination
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", 20))
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", PAGE_SIZE))
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", 10))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 100))
+COMMENT_PAGE_SIZE = int(os.getenv("COMMENT_PAGE_SIZE", PAGE_SIZE))
+
+# Lists requested with ?stream=true: rows read and encoded per chunk, and the most rows sent
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 500))
+STREAM_MAX_ROWS = int(os.getenv("STREAM_MAX_ROWS", 10000))
+
+# Rows per database round trip of account data exports
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
+
+# Rows deleted per transaction by the reap command
+REAP_CHUNK_SIZE = int(os.getenv("REAP_CHUNK_SIZE", 1000))
+
+# Newest comments embedded in each post, the rest are paged from the comments endpoint
+COMMENT_PREVIEW_SIZE = int(os.getenv("COMMENT_PREVIEW_SIZE", 3))
+
+# Who to follow: suggestions kept per user, the longest follow list read per hop,
+# and the weight of co-followers relative to friends of friends
+SUGGESTIONS_PER_USER = int(os.getenv("SUGGESTIONS_PER_USER", 20))
+SUGGESTION_NEIGHBOUR_LIMIT = int(os.getenv("SUGGESTION_NEIGHBOUR_LIMIT", 1000))
+SUGGESTION_COFOLLOW_WEIGHT = float(os.getenv("SUGGESTION_COFOLLOW_WEIGHT", 0.5))
+
+# Explore feed: posts ranked by their creation, likes and comments, each weighted and halved in
+# value every TRENDING_HALF_LIFE_HOURS. The score_trending command keeps the scores current and
+# must be run with --full after the half life or a weight changes. TRENDING_POST_WEIGHT must be
+# positive, it is what ranks posts without engagement by recency.
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", 12))
+TRENDING_POST_WEIGHT = float(os.getenv("TRENDING_POST_WEIGHT", 1))
+TRENDING_LIKE_WEIGHT = float(os.getenv("TRENDING_LIKE_WEIGHT", 1))
+TRENDING_COMMENT_WEIGHT = float(os.getenv("TRENDING_COMMENT_WEIGHT", 3))
+# Engagement committed this long after it was stamped is still picked up by the next run
+TRENDING_OVERLAP_SECONDS = int(os.getenv("TRENDING_OVERLAP_SECONDS", 60))
+# Posts this recent are rescored by every run, so removed likes and comments lower their scores.
+# Older posts are rescored when they gain engagement, or by a --full run.
+TRENDING_WINDOW_HOURS = float(os.getenv("TRENDING_WINDOW_HOURS", 72))
+
+# Largest number of ids accepted by the batch like/follow endpoints
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 100))
+
+# Timelines: posts of authors with more followers than this when they post are merged into
+# feeds at read time, and a timeline keeps its newest TIMELINE_MAX_ENTRIES posts
+FANOUT_MAX_FOLLOWERS = int(os.getenv("FANOUT_MAX_FOLLOWERS", 10000))
+FANOUT_BATCH_SIZE = int(os.getenv("FANOUT_BATCH_SIZE", 1000))
+TIMELINE_BACKFILL = int(os.getenv("TIMELINE_BACKFILL", 100))
+TIMELINE_MAX_ENTRIES = int(os.getenv("TIMELINE_MAX_ENTRIES", 1000))
+
 # CORS
 CORS_ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS").split(",")
 
 # Emai
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv("EMAIL")
-EMAIL_HOST_PASSWORD = os.getenv("MAIL_PASSWORD")
\ No newline at end of file
+EMAIL_HOST_PASSWORD = os.getenv("MAIL_PASSWORD")
+
+# Outbox worker: failed sends are retried after OUTBOX_BACKOFF_SECONDS * 2 ** attempts
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", 30))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", 300))